@@ -0,0 +1,401 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+import httpx
+import cache
+import transport
+import upload
+from eclypse import api_base_url, cache_info_device, DOWNLOAD_CHUNK_SIZE, PropertyValue
+
+
+# Async twin of the eclypse module
+# Functions have the same names and arguments as eclypse, but must be awaited
+# and take an httpx.AsyncClient in place of a requests session
+# The device cache locks and writes a file, so it is used from a worker thread
+# rather than blocking the event loop and every other ECLYPSE in progress
+
+
+def client(username, password, **kwargs):
+    """Return an AsyncClient set up for the ECLYPSE local API"""
+    # ECLYPSE local API requires HTTP basic authentiation
+    # Certificate verification is disabled when using default self-signed certificate
+    return httpx.AsyncClient(auth=(username, password), verify=False, timeout=30, **kwargs)
+
+
+# REST methods
+async def api_post(session, host, path, body, version=1, timeout=None):
+    """POST to API"""
+    url = f'{api_base_url(host, version)}{path}'
+    headers = {'Content-type': 'application/json'}
+    result = await transport.arequest(session, 'POST', url, json=body, headers=headers, timeout=timeout)
+    result.raise_for_status()
+    return result
+
+
+async def api_post_store(session, host, path, body, version=2, timeout=transport.UPLOAD_TIMEOUT):
+    """POST a file to a v2 /store via API"""
+    url = f'{api_base_url(host, version)}{path}'
+    headers = {'Content-type': 'application/octet-stream'}
+    result = await transport.arequest(session, 'POST', url, content=body, headers=headers, timeout=timeout)
+    result.raise_for_status()
+    return result
+
+
+async def api_get(session, host, path, version=1, timeout=None):
+    """GET from API"""
+    url = f'{api_base_url(host, version)}{path}'
+    headers = {'accept': 'application/json'}
+
+    result = await transport.arequest(session, 'GET', url, headers=headers, timeout=timeout)
+    result.raise_for_status()
+    return result
+
+
+async def api_get_store(session, host, path, version=1, timeout=None):
+    """GET from API"""
+    url = f'{api_base_url(host, version)}{path}'
+    headers = {'Accept': '*/*'}
+
+    result = await transport.arequest(session, 'GET', url, headers=headers, timeout=timeout)
+    result.raise_for_status()
+    return result
+
+
+async def api_download_store(session, host, path, destination, version=1, timeout=None):
+    """Stream a file from a store to disk and return its sha256
+
+    The file is written to destination.part and renamed when complete, so destination is never
+    left half written. A .part file left by an interrupted download is resumed with a Range request.
+    The checksum is recorded alongside in destination.sha256.
+    """
+    url = f'{api_base_url(host, version)}{path}'
+    partial = f'{destination}.part'
+
+    while True:
+        offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+        headers = {'Accept': '*/*'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        result = await transport.arequest(session, 'GET', url, headers=headers, timeout=timeout, stream=True)
+        try:
+            # The partial file does not match the file on the ECLYPSE, start over
+            if result.status_code == 416:
+                os.remove(partial)
+                continue
+            result.raise_for_status()
+
+            digest = hashlib.sha256()
+            if result.status_code == 206:
+                # Resume, the checksum must include the bytes already on disk
+                mode = 'ab'
+                with open(partial, 'rb') as infile:
+                    for chunk in iter(lambda: infile.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+            else:
+                # The ECLYPSE ignored the Range header and sent the whole file
+                mode = 'wb'
+
+            with open(partial, mode) as outfile:
+                async for chunk in result.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    outfile.write(chunk)
+                    digest.update(chunk)
+        finally:
+            await result.aclose()
+        break
+
+    os.replace(partial, destination)
+
+    checksum = digest.hexdigest()
+    with open(f'{destination}.sha256', 'w') as outfile:
+        outfile.write(f'{checksum}  {os.path.basename(destination)}\n')
+
+    return checksum
+
+
+async def api_put(session, host, path, body, version=1, timeout=None):
+    """PUT to API"""
+    url = f'{api_base_url(host, version)}{path}'
+    headers = {'Content-type': 'application/json'}
+    result = await transport.arequest(session, 'PUT', url, json=body, headers=headers, timeout=timeout)
+    result.raise_for_status()
+    return result
+
+
+async def api_delete(session, host, path, version=1, timeout=None):
+    """Delete via API"""
+    url = f'{api_base_url(host, version)}{path}'
+    headers = {'Content-type': 'application/json'}
+    result = await transport.arequest(session, 'DELETE', url, headers=headers, timeout=timeout)
+    result.raise_for_status()
+    return result
+
+
+async def get_info_device(session, host):
+    """Get ECLYPSE device information"""
+    result = await api_get(session, host, '/info/device')
+    await asyncio.to_thread(cache_info_device, host, result)
+    return result
+
+
+async def api_version(session, host):
+    """Returns the ECY API Version, from the device cache when known"""
+    version = await asyncio.to_thread(cache.get, host, 'api_version')
+    if version:
+        return version
+
+    version = await detect_api_version(session, host)
+    if version:
+        await asyncio.to_thread(cache.put, host, 'api_version', version)
+    return version
+
+
+async def detect_api_version(session, host):
+    """Returns the ECY API Version based on a successful call"""
+    headers = {'accept': 'application/json'}
+
+    v1_url = f'{api_base_url(host, 1)}'
+    v1_result = await transport.arequest(session, 'GET', v1_url, headers=headers)
+    if v1_result.is_success:
+        return 1
+
+    v2_url = f'{api_base_url(host, 2)}/services'
+    v2_result = await transport.arequest(session, 'GET', v2_url, headers=headers)
+    if v2_result.is_success:
+        return 2
+
+
+async def get_services_v1(session, host):
+    """Returns list of ECY 1 services"""
+    return await api_get(session, host, '', version=1)
+
+
+async def get_services_v2(session, host):
+    """Returns list of ECY 2 services"""
+    # Note: this list can change as packages extend the API
+    return await api_get(session, host, '/services', version=2)
+
+
+# Hostname
+
+async def get_hostname(session, host):
+    method = "/system/web-server"
+    return await api_get(session, host, method)
+
+
+async def set_hostname(session, host, hostname):
+    method = "/system/web-server"
+    data = {'hostname': hostname}
+    result = await api_post(session, host, method, data)
+    await asyncio.to_thread(cache.invalidate, host, ['device_hostname'])
+    return result
+
+
+# MSTP
+
+async def get_mstp(session, host, port=1):
+    method = f'/protocols/bacnet/communication/network/mstp-ports/{int(port)}'
+    return await api_get(session, host, method)
+
+
+async def set_mstp(session, host, data, port=1):
+    method = f'/protocols/bacnet/communication/network/mstp-ports/{int(port)}'
+    return await api_post(session, host, method, data)
+
+
+async def enable_mstp(session, host):
+    data = {'enabled': True}
+    return await set_mstp(session, host, data, port=1)
+
+
+async def disable_mstp(session, host):
+    data = {'enabled': False}
+    return await set_mstp(session, host, data, port=1)
+
+
+async def set_mstp_priority(session, host):
+    data = {'id': 1, 'priority': 50}
+    return await set_mstp(session, host, data, port=1)
+
+
+# BACnet IP
+
+async def get_bacnet_ip(session, host, port=1):
+    method = f'/protocols/bacnet/communication/network/ip-ports/{int(port)}'
+    return await api_get(session, host, method)
+
+
+async def set_bacnet_ip(session, host, data, port=1):
+    method = f'/protocols/bacnet/communication/network/ip-ports/{int(port)}'
+    return await api_post(session, host, method, data)
+
+
+async def enable_bacnet_ip(session, host):
+    data = {'enabled': True}
+    return await set_bacnet_ip(session, host, data, port=1)
+
+
+async def disable_bacnet_ip(session, host):
+    data = {'enabled': False}
+    return await set_bacnet_ip(session, host, data, port=1)
+
+
+# Wifi
+
+async def get_wifi(session, host, port='primary'):
+    method = f'/system/network/adapters/wireless/{port}'
+    return await api_get(session, host, method)
+
+
+async def set_wifi(session, host, data, port='primary'):
+    method = f'/system/network/adapters/wireless/{port}'
+    return await api_post(session, host, method, data)
+
+
+async def enable_wifi(session, host):
+    data = {'enabled': True, 'mode': 'hotspot'}
+    return await set_wifi(session, host, data, port='primary')
+
+
+async def disable_wifi(session, host):
+    data = {'enabled': False}
+    return await set_wifi(session, host, data, port='primary')
+
+
+# Firmware
+
+async def get_eclypse_firmware_version(session, host):
+    return (await get_info_device(session, host)).json()['softwareVersion']
+
+
+async def update_eclypse_firmware(session, host, update_file, progress=None, limiter=None):
+    """Upload a firmware zip, update_file is a path or an upload.SharedFile shared by every host
+
+    limiter, such as rollout.TokenBucket, limits the combined upload rate of every host.
+    """
+    path = "/system/update/firmware"
+    url = f'{api_base_url(host)}{path}'
+
+    with upload.shared(update_file) as firmware:
+        # The limiter sleeps, so it is applied here in a worker thread rather than by the reader
+        body = firmware.multipart('file', progress)
+        headers = {'Content-Type': body.content_type, 'Content-Length': str(len(body))}
+        result = await transport.arequest(session, 'POST', url, content=_stream(body, limiter), headers=headers,
+                                          timeout=transport.UPLOAD_TIMEOUT)
+
+    # Firmware and API version will change after the ECLYPSE reboots, the model and hostname do not
+    await asyncio.to_thread(cache.invalidate, host, ['firmware', 'api_version'])
+    return result
+
+
+async def _stream(body, limiter=None):
+    """Yield the blocks of an upload body, waiting for the limiter before each"""
+    while True:
+        block = body.read(upload.CHUNK_SIZE)
+        if not block:
+            return
+        if limiter:
+            await asyncio.to_thread(limiter.consume, len(block))
+        # A copy, so the shared file can be closed once the upload is done
+        yield bytes(block)
+
+
+async def wait_for_version(session, host, version, timeout=900, interval=10, max_interval=60):
+    """Poll device information with backoff after a firmware upload and return the version reported
+
+    Returns as soon as the ECLYPSE reports `version`. An ECLYPSE that refused connections
+    while it rebooted and came back on another version did not take the firmware, its version
+    is returned right away. Error responses and slow responses while the ECLYPSE verifies the
+    firmware are not taken as a reboot. Otherwise the last version reported is returned after
+    `timeout` seconds, or None if the ECLYPSE never answered.
+    """
+    end = time.monotonic() + timeout
+    rebooted = False
+    reported = None
+
+    while True:
+        try:
+            # Polled outside the circuit breaker, the ECLYPSE is expected to be offline while it reboots
+            result = await transport.arequest(session, 'GET', f'{api_base_url(host)}/info/device',
+                                              headers={'accept': 'application/json'}, retries=0, use_breaker=False)
+            result.raise_for_status()
+            await asyncio.to_thread(cache_info_device, host, result)
+            reported = result.json()['softwareVersion']
+            if reported == version or rebooted:
+                return reported
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            # No connection, the ECLYPSE is rebooting
+            rebooted = True
+        except httpx.HTTPError:
+            # Still verifying the firmware, such as a 503 or a read timeout
+            pass
+
+        if time.monotonic() >= end:
+            return reported
+
+        # Back off with jitter so many ECLYPSE are not polled in lockstep
+        await asyncio.sleep(min(interval * random.uniform(0.8, 1.2), max(end - time.monotonic(), 0)))
+        interval = min(interval * 2, max_interval)
+
+
+async def reboot_controller(session, host):
+    path = "/protocols/bacnet/local/management/coldStart"
+    data = {}
+
+    return await api_post(session, host, path, data)
+
+
+# BACnet local objects
+
+async def get_local_property(session, host, object_type, instance, property='present-value'):
+    """Read a property of a local BACnet object, ex. analog-value 5000 present-value"""
+    method = f'/protocols/bacnet/local/objects/{object_type}/{int(instance)}/properties/{property}'
+    return (await api_get(session, host, method)).json()['value']
+
+
+async def read_local_properties(session, host, points, workers=8):
+    """Read many local object properties from one ECLYPSE concurrently
+
+    points is a list of (object_type, instance) or (object_type, instance, property) tuples,
+    property defaults to present-value. Returns a PropertyValue for every point in the same order,
+    a point that could not be read has error set instead of value. At most `workers` requests
+    are in flight at once. A connection failure is raised rather than recorded.
+    """
+    points = [(point[0], int(point[1]), point[2] if len(point) > 2 else 'present-value') for point in points]
+    limit = asyncio.Semaphore(workers)
+
+    async def read(point):
+        async with limit:
+            try:
+                return PropertyValue(*point, value=await get_local_property(session, host, *point))
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                raise
+            except Exception as e:
+                return PropertyValue(*point, error=str(e))
+
+    return list(await asyncio.gather(*(read(point) for point in points)))
+
+
+# Time
+
+async def get_time(session, host):
+    path = "/system/date-time"
+    return await api_get(session, host, path)
+
+
+async def set_time(session, host, data):
+    method = "/system/date-time"
+
+    return await api_post(session, host, method, data)
+
+
+async def change_time_zone(session, host, timezone):
+    data = {'timeZone': timezone, 'autoTime': True}
+
+    return await set_time(session, host, data)
+
+
+if __name__ == '__main__':
+    pass
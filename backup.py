@@ -1,6 +1,15 @@
+import os
+import random
+import time
+import backup_store
+import cache
 import eclypse
 
 
+# Record of the last backup downloaded from each ECLYPSE, kept in the download directory or store
+MANIFEST_FILE = 'backup_manifest.json'
+
+
 # API v1
 def list_v1(session, hostname):
     """Return list of Eclypse Backups"""
@@ -46,13 +55,15 @@ def latest_v1(session, hostname):
     return sorted([backup['name'] for backup in list_v1(session, hostname)], reverse=True)[0]
 
 
-def download_v1(session, hostname):
-    """Download the latest v1 backup"""
+def download_v1(session, hostname, directory='.', name=None):
+    """Download the named or latest v1 backup to <directory>/<backup name>.zip"""
     try:
-        latest_backup = latest_v1(session, hostname)
+        latest_backup = name or latest_v1(session, hostname)
         api_url = f'/files/backup/{latest_backup}.ecybackup?encode=bin'
+        destination = os.path.join(directory, f'{latest_backup}.zip')
 
-        return latest_backup, eclypse.api_get_store(session, hostname, api_url, version=1)
+        eclypse.api_download_store(session, hostname, api_url, destination, version=1)
+        return latest_backup, destination
         
     except Exception as e:
         raise e
@@ -66,13 +77,15 @@ def latest_v2(session, hostname):
     return latest
 
 
-def download_v2(session, hostname):
-    """Download the latest v2 backup"""
+def download_v2(session, hostname, directory='.', name=None):
+    """Download the named or latest v2 backup to <directory>/<backup name>.zip"""
     try:
-        latest_backup = latest_v2(session, hostname)
+        latest_backup = name or latest_v2(session, hostname)
         api_url = f'/services/backup/store/{latest_backup}'
+        destination = os.path.join(directory, f'{latest_backup}.zip')
 
-        return latest_backup, eclypse.api_get_store(session, hostname, api_url, version=2)
+        eclypse.api_download_store(session, hostname, api_url, destination, version=2)
+        return latest_backup, destination
         
     except Exception as e:
         raise e
@@ -137,18 +150,134 @@ def list_backups(session, host, api_version=None):
         raise e
 
 
-def download_backups(session, host, api_version=None):
-    """Download Backups"""
+def latest(session, host, api_version=None):
+    """Return the name of the latest backup"""
+    try:
+        if not api_version:
+            api_version = eclypse.api_version(session, host)
+
+        if api_version == 1:
+            return latest_v1(session, host)
+        elif api_version == 2:
+            return latest_v2(session, host)
+
+        raise Exception('Unknown API')
+
+    except Exception as e:
+        raise e
+
+
+def names(session, host, api_version=None):
+    """Return the set of backup names on either ECY version"""
+    return {backup['name'] if isinstance(backup, dict) else backup
+            for backup in list_backups(session, host, api_version=api_version)}
+
+
+def _listed_size(details):
+    """Size of a backup from its entry in the backup list, or None if not listed"""
+    if isinstance(details, dict):
+        for key in ('size', 'fileSize'):
+            if isinstance(details.get(key), int):
+                return details[key]
+    return None
+
+
+def sizes(session, host, api_version=None):
+    """Return the listed size of each backup by name, None when the ECLYPSE does not report it"""
+    if not api_version:
+        api_version = eclypse.api_version(session, host)
+
+    if api_version == 1:
+        return {backup['name']: _listed_size(backup) for backup in list_v1(session, host)}
+    elif api_version == 2:
+        listed = eclypse.api_get(session, host, '/services/backup/backups', version=2).json()
+        return {name: _listed_size(details) for name, details in listed.items()}
+
+    raise Exception('Unknown API')
+
+
+def wait_for_new(session, host, existing, api_version=None, timeout=1800, interval=5, max_interval=60):
+    """Poll the backup list with backoff until a backup not in existing is complete and return its name
+
+    A backup is listed while it is still being written, so it is only taken as complete once two
+    polls in a row list it with the same size.
+    """
+    end = time.monotonic() + timeout
+    settle_interval = interval
+    previous = {}
+
+    while True:
+        new = {name: size for name, size in sizes(session, host, api_version=api_version).items()
+               if name not in existing}
+        if new:
+            newest = max(new)
+            if newest in previous and previous[newest] == new[newest]:
+                return newest
+            # Check again soon rather than after the backoff grew while waiting
+            interval = settle_interval
+        previous = new
+
+        if time.monotonic() >= end:
+            if new:
+                raise Exception(f'Backup {max(new)} still being written after {timeout} seconds')
+            raise Exception(f'Backup not created after {timeout} seconds')
+
+        # Back off with jitter so many ECLYPSE are not polled in lockstep
+        time.sleep(min(interval * random.uniform(0.8, 1.2), max(end - time.monotonic(), 0)))
+        interval = min(interval * 2, max_interval)
+
+
+def download_backups(session, host, api_version=None, directory='.', name=None):
+    """Download the named or latest backup, returns the backup name and the path of the downloaded file"""
     try:
         if not api_version:
             api_version = eclypse.api_version(session, host)
 
         if api_version == 1:
-            return download_v1(session, host)
+            return download_v1(session, host, directory, name)
         elif api_version == 2:
-            return download_v2(session, host)
+            return download_v2(session, host, directory, name)
 
         raise Exception('Unknown API')
 
     except Exception as e:
-        raise e
\ No newline at end of file
+        raise e
+
+
+# Manifest of downloaded backups, shared by eclypse_backup_download.py and eclypse_backup_pipeline.py
+
+
+def open_manifest(directory='.', store=None):
+    """Return the manifest of downloaded backups kept in the store, or the download directory"""
+    return cache.JsonStore(os.path.join(store or directory, MANIFEST_FILE))
+
+
+def already_downloaded(manifest, hostname, backup_name, store=None):
+    """True if a backup was downloaded by a previous run and is still on disk"""
+    entry = manifest.get(hostname)
+    if not entry or entry['backup_name'] != backup_name:
+        return False
+
+    if store:
+        return backup_store.snapshot_path(store, hostname, backup_name).is_file()
+    return os.path.isfile(entry['file'])
+
+
+def save_download(manifest, hostname, file_name, file_path, store=None):
+    """Record a downloaded backup in the manifest and return the report row
+
+    With a store, only the chunks that changed since the last backup are kept and the download is removed.
+    """
+    entry = {'backup_name': file_name, 'file': file_path, 'size': os.path.getsize(file_path), 'date': time.strftime("%Y-%m-%d %H:%M:%S")}
+
+    if not store:
+        manifest.set(hostname, entry)
+        return {'host': hostname, 'backup_name': file_name, 'file': file_path, 'downloaded': True}
+
+    # Keep only the chunks that changed since the last backup, then discard the download
+    summary = backup_store.add(store, hostname, file_name, file_path)
+    os.remove(file_path)
+    os.remove(f'{file_path}.sha256')
+    manifest.set(hostname, {**entry, 'file': None})
+
+    return {'host': hostname, 'backup_name': file_name, 'downloaded': True, **summary}
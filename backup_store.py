@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import pathlib
+import random
+import struct
+import threading
+import time
+import zipfile
+
+
+# Content addressed store for ECLYPSE backups
+# Backups are split into chunks and each chunk is stored once, named by its sha256.
+# A snapshot lists the chunks of one backup, so any backup can be rebuilt byte for byte.
+# Most of a backup is unchanged from one day to the next, so each new backup only adds
+# the chunks that changed.
+#
+# Layout:
+#   <repository>/chunks/<first 2 hex digits>/<sha256>
+#   <repository>/snapshots/<hostname>/<backup name>.json
+
+# Chunks are split so they are never larger than this
+MAX_CHUNK = 1024 * 1024
+# Content defined chunking for files that are not zip archives
+MIN_CHUNK = 16 * 1024
+CHUNK_MASK = (1 << 16) - 1  # average chunk of 64 KB
+
+# Gear table for the rolling hash, seeded so chunk boundaries are stable between runs
+_GEAR = [random.Random(i).getrandbits(32) for i in range(256)]
+# Low 16 bits of each gear value, as tables for bytes.translate
+_GEAR_LOW = bytes(gear & 0xFF for gear in _GEAR)
+_GEAR_HIGH = bytes(gear >> 8 & 0xFF for gear in _GEAR)
+_LANE_MASK = b'\xff\xff\x00\x00'
+
+# Zip local file header: signature, versions, flags, method, time, date, crc, sizes, name/extra lengths
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+
+
+def zip_boundaries(path):
+    """Return chunk boundaries that separate every zip member's header from its compressed data
+
+    Members that did not change have identical compressed data in every backup, even when
+    their headers (timestamps) change, so their data chunks are shared between snapshots.
+    Returns None if the file is not a zip archive.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = archive.infolist()
+    except zipfile.BadZipFile:
+        return None
+
+    size = os.path.getsize(path)
+    boundaries = {0, size}
+
+    with open(path, 'rb') as infile:
+        for member in members:
+            infile.seek(member.header_offset)
+            header = infile.read(_LOCAL_HEADER.size)
+            if len(header) < _LOCAL_HEADER.size:
+                return None
+            name_length, extra_length = _LOCAL_HEADER.unpack(header)[-2:]
+
+            data_offset = member.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+            boundaries.update((member.header_offset, data_offset, data_offset + member.compress_size))
+
+    return sorted(offset for offset in boundaries if 0 <= offset <= size)
+
+
+def _hash_matches(path):
+    """Yield every position where the low bits of the gear hash selected by CHUNK_MASK are zero
+
+    The 16 bits of CHUNK_MASK only depend on the last 16 bytes, so they are computed for a whole
+    block at once. Each byte's gear value is placed in its own 32 bit lane of a large integer,
+    the sum of the integer shifted by k lanes and k bits for k below 16 holds every position's
+    hash in its lane, without carrying into the next lane.
+    """
+    window = 16
+    offset = 0
+    tail = b''
+
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(MAX_CHUNK), b''):
+            data = tail + block
+            lanes = bytearray(4 * len(data))
+            lanes[0::4] = data.translate(_GEAR_LOW)
+            lanes[1::4] = data.translate(_GEAR_HIGH)
+            gears = int.from_bytes(lanes, 'little')
+
+            # Sums over windows of 2, 4, 8 and then 16 bytes
+            rolling = gears
+            for span in (1, 2, 4, 8):
+                rolling += rolling << (33 * span)
+            rolling &= int.from_bytes(_LANE_MASK * len(data), 'little')
+            hashes = rolling.to_bytes(4 * len(data) + 8, 'little')
+
+            # Lanes of four zero bytes, the lanes of the previous block's tail were already reported
+            found = hashes.find(bytes(4), 4 * len(tail))
+            while 0 <= found < 4 * len(data):
+                if found % 4 == 0:
+                    yield offset + found // 4 - len(tail) + 1
+                found = hashes.find(bytes(4), found + 1)
+
+            offset += len(block)
+            tail = data[-(window - 1):]
+
+
+def content_boundaries(path):
+    """Return chunk boundaries chosen by a gear rolling hash of the file contents"""
+    boundaries = [0]
+    start = 0
+
+    for position in _hash_matches(path):
+        while position - start > MAX_CHUNK:
+            start += MAX_CHUNK
+            boundaries.append(start)
+        if position - start >= MIN_CHUNK:
+            boundaries.append(position)
+            start = position
+
+    size = os.path.getsize(path)
+    while size - start > MAX_CHUNK:
+        start += MAX_CHUNK
+        boundaries.append(start)
+    if boundaries[-1] != size:
+        boundaries.append(size)
+    return boundaries
+
+
+def chunks(path):
+    """Yield the chunks of a backup file"""
+    boundaries = zip_boundaries(path) or content_boundaries(path)
+
+    with open(path, 'rb') as infile:
+        for start, end in zip(boundaries, boundaries[1:]):
+            # Split long spans, such as a large compressed member
+            for offset in range(start, end, MAX_CHUNK):
+                yield infile.read(min(MAX_CHUNK, end - offset))
+
+
+def chunk_path(repository, digest):
+    return pathlib.Path(repository, 'chunks', digest[:2], digest)
+
+
+def snapshot_path(repository, hostname, name):
+    return pathlib.Path(repository, 'snapshots', hostname, f'{name}.json')
+
+
+def add(repository, hostname, name, path):
+    """Add a downloaded backup file to the store and return a summary of what was stored"""
+    digest = hashlib.sha256()
+    chunk_list = []
+    size = 0
+    stored = 0
+
+    for chunk in chunks(path):
+        chunk_digest = hashlib.sha256(chunk).hexdigest()
+        chunk_list.append(chunk_digest)
+        digest.update(chunk)
+        size += len(chunk)
+
+        # Only new chunks are written
+        destination = chunk_path(repository, chunk_digest)
+        if destination.is_file():
+            continue
+
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, another worker may be storing the same chunk
+        temp_path = destination.with_name(f'{chunk_digest}.{threading.get_ident()}.tmp')
+        with open(temp_path, 'wb') as outfile:
+            outfile.write(chunk)
+        os.replace(temp_path, destination)
+        stored += len(chunk)
+
+    snapshot = {'host': hostname,
+                'name': name,
+                'time': time.time(),
+                'size': size,
+                'sha256': digest.hexdigest(),
+                'chunks': chunk_list}
+
+    destination = snapshot_path(repository, hostname, name)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with open(destination, 'w') as outfile:
+        json.dump(snapshot, outfile)
+
+    return {'size': size, 'stored': stored, 'chunks': len(chunk_list)}
+
+
+def snapshots(repository, hostname):
+    """Return the snapshots stored for an ECLYPSE, oldest first"""
+    found = []
+    for path in pathlib.Path(repository, 'snapshots', hostname).glob('*.json'):
+        with open(path) as infile:
+            snapshot = json.load(infile)
+        del snapshot['chunks']
+        found.append(snapshot)
+
+    return sorted(found, key=lambda snapshot: snapshot['time'])
+
+
+def find(repository, hostname, name=None, before=None):
+    """Return name if provided, otherwise the name of the latest snapshot stored at or before a unix time"""
+    if name:
+        return name
+
+    candidates = [snapshot for snapshot in snapshots(repository, hostname)
+                  if before is None or snapshot['time'] <= before]
+    if not candidates:
+        raise Exception(f'No backup stored for {hostname}')
+    return candidates[-1]['name']
+
+
+def restore(repository, hostname, name, destination):
+    """Rebuild a stored backup file and verify its checksum"""
+    with open(snapshot_path(repository, hostname, name)) as infile:
+        snapshot = json.load(infile)
+
+    digest = hashlib.sha256()
+    temp_path = f'{destination}.part'
+    with open(temp_path, 'wb') as outfile:
+        for chunk_digest in snapshot['chunks']:
+            with open(chunk_path(repository, chunk_digest), 'rb') as infile:
+                chunk = infile.read()
+            digest.update(chunk)
+            outfile.write(chunk)
+
+    if digest.hexdigest() != snapshot['sha256']:
+        os.remove(temp_path)
+        raise Exception(f'Checksum mismatch restoring {name} for {hostname}')
+
+    os.replace(temp_path, destination)
+    return destination
+
+
+if __name__ == '__main__':
+    pass
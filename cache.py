@@ -0,0 +1,220 @@
+import atexit
+import contextlib
+import json
+import os
+import pathlib
+import threading
+import time
+
+
+# Details about each ECLYPSE are kept between runs in this file
+CACHE_FILE = './eclypse_cache.json'
+# Cached details are trusted for this many seconds
+DEFAULT_TTL = 7 * 24 * 60 * 60
+# Seconds each detail is trusted for, details not listed use DEFAULT_TTL
+# The hardware model never changes, firmware and GFX can be changed by other tools
+TTLS = {
+    'model': 90 * 24 * 60 * 60,
+    'api_version': 30 * 24 * 60 * 60,
+    'firmware': 24 * 60 * 60,
+    'gfx_name': 24 * 60 * 60,
+    'device_hostname': 7 * 24 * 60 * 60,
+}
+# Changes are written to disk at most this often (seconds) and when the script exits
+SAVE_INTERVAL = 60
+# If False, every lookup misses and nothing is written
+ENABLED = True
+# Seconds to wait for another tool to finish writing the file, and after which its lock is treated as abandoned
+LOCK_TIMEOUT = 10
+LOCK_STALE = 60
+# Time every detail of an ECLYPSE was invalidated
+INVALIDATED = '_invalidated'
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold a lock file next to path so only one process writes it at a time"""
+    lock_path = f'{path}.lock'
+    end = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # A tool that was killed while writing leaves its lock behind
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_STALE or time.monotonic() > end:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            time.sleep(0.05)
+
+    try:
+        os.close(fd)
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def _merge(theirs, ours):
+    """Combine an entry changed by this process with the entry written by another process
+
+    Details holding a time, such as cached facts, keep whichever version is newer.
+    """
+    if not isinstance(theirs, dict) or not isinstance(ours, dict):
+        return ours
+
+    merged = dict(theirs)
+    for name, detail in ours.items():
+        other = theirs.get(name)
+        if isinstance(detail, dict) and isinstance(other, dict) and other.get('time', 0) > detail.get('time', 0):
+            continue
+        merged[name] = detail
+    return merged
+
+
+class JsonStore:
+    """Thread safe dictionary persisted to a JSON file
+
+    Several processes can share the file, each save merges the keys this process changed
+    into the file as it is on disk.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.lock = threading.RLock()
+        self.saved = time.monotonic()
+        # Keys set or removed since the last save
+        self.changed = set()
+        self.removed = set()
+        self.data = self._load()
+
+    @property
+    def dirty(self):
+        return bool(self.changed or self.removed)
+
+    def _load(self):
+        try:
+            with open(self.path) as infile:
+                return json.load(infile)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.changed.add(key)
+            self.removed.discard(key)
+            if time.monotonic() - self.saved > SAVE_INTERVAL:
+                self.save()
+
+    def pop(self, key, default=None):
+        with self.lock:
+            self.removed.add(key)
+            self.changed.discard(key)
+            return self.data.pop(key, default)
+
+    def keys(self):
+        with self.lock:
+            return list(self.data.keys())
+
+    def save(self):
+        """Write changes to disk, the file is replaced atomically so readers never see a partial file"""
+        with self.lock:
+            if not self.dirty:
+                return
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with file_lock(self.path):
+                # Keep the changes other tools saved since this file was read
+                data = self._load()
+                for key in self.changed:
+                    data[key] = _merge(data.get(key), self.data[key])
+                for key in self.removed:
+                    data.pop(key, None)
+
+                temp_path = self.path.with_name(self.path.name + '.tmp')
+                with open(temp_path, 'w') as outfile:
+                    json.dump(data, outfile)
+                os.replace(temp_path, self.path)
+
+            self.data = data
+            self.changed.clear()
+            self.removed.clear()
+            self.saved = time.monotonic()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    """Return the device cache, loading it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JsonStore(CACHE_FILE)
+            atexit.register(_store.save)
+        return _store
+
+
+_DETAIL_TTL = object()
+
+
+def get(hostname, name, ttl=_DETAIL_TTL):
+    """Return a cached detail for an ECLYPSE, or None if unknown or older than ttl seconds
+
+    ttl defaults to the detail's entry in TTLS, None trusts the detail however old it is.
+    """
+    if not ENABLED:
+        return None
+    if ttl is _DETAIL_TTL:
+        ttl = TTLS.get(name, DEFAULT_TTL)
+
+    details = store().get(hostname, {})
+    entry = details.get(name)
+    # Invalidated details are kept with only a time, so the invalidation is not undone by another tool
+    if entry is None or 'value' not in entry:
+        return None
+    if entry['time'] <= details.get(INVALIDATED, {}).get('time', 0):
+        return None
+    if ttl is not None and time.time() - entry['time'] > ttl:
+        return None
+    return entry['value']
+
+
+def put(hostname, name, value):
+    """Record a detail for an ECLYPSE"""
+    if not ENABLED:
+        return
+
+    with store().lock:
+        details = dict(store().get(hostname, {}))
+        details[name] = {'value': value, 'time': time.time()}
+        store().set(hostname, details)
+
+
+def invalidate(hostname, names=None):
+    """Forget the listed details for an ECLYPSE, or everything if names is not provided"""
+    if not ENABLED:
+        return
+
+    with store().lock:
+        details = dict(store().get(hostname, {}))
+        if names is None:
+            # Covers details this process has not seen, which another tool may have saved
+            details = {INVALIDATED: {'time': time.time()}}
+        for name in names or []:
+            details[name] = {'time': time.time()}
+        store().set(hostname, details)
+
+
+if __name__ == '__main__':
+    pass
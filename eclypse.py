@@ -1,11 +1,22 @@
+import concurrent.futures
+import hashlib
+import os
+import random
+import time
+from typing import NamedTuple
 from requests import exceptions
-from requests_toolbelt.multipart.encoder import MultipartEncoder
+import cache
+import transport
+import upload
 
 
 # API Resource Paths
 V1_PATH = 'api/rest/v1'
 V2_PATH = 'api/rest/v2'
 
+# Size of each block written to disk while downloading from a store
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
 
 # Base URL for the Eclypse APIs
 def api_base_url(hostname, version=1):
@@ -16,79 +27,154 @@ def api_base_url(hostname, version=1):
 
 
 # REST methods
-def api_post(session, host, path, body, version=1):
+# Requests are sent through transport, which applies timeouts, retries and the circuit breaker
+# timeout is (connect, read) seconds, None for the transport default
+def api_post(session, host, path, body, version=1, timeout=None):
     """POST to API"""
     url = f'{api_base_url(host, version)}{path}'
     headers = {'Content-type': 'application/json'}
-    result = session.post(url, json=body, headers=headers)
+    result = transport.request(session, 'POST', url, json=body, headers=headers, timeout=timeout)
     result.raise_for_status()
     return result
 
 
-def api_post_store(session, host, path, body, version=2):
+def api_post_store(session, host, path, body, version=2, timeout=transport.UPLOAD_TIMEOUT):
     """POST a file to a v2 /store via API"""
     url = f'{api_base_url(host, version)}{path}'
     headers = {'Content-type': 'application/octet-stream'}
-    result = session.post(url, data=body, headers=headers)
+    result = transport.request(session, 'POST', url, data=body, headers=headers, timeout=timeout)
     result.raise_for_status()
     return result
 
 
 
-def api_get(session, host, path, version=1): # Throws requests error
+def api_get(session, host, path, version=1, timeout=None): # Throws requests error
     """GET from API"""
     url = f'{api_base_url(host, version)}{path}'
     headers = {'accept': 'application/json'}
 
-    result = session.get(url, headers=headers, timeout=30)
+    result = transport.request(session, 'GET', url, headers=headers, timeout=timeout)
     result.raise_for_status()
     return result
 
 # Downloading files from a store requires a different header
-def api_get_store(session, host, path, version=1): # Throws requests error
+def api_get_store(session, host, path, version=1, timeout=None): # Throws requests error
     """GET from API"""
     url = f'{api_base_url(host, version)}{path}'
     headers = { 'Accept': '*/*' }
 
-    result = session.get(url, headers=headers)
+    result = transport.request(session, 'GET', url, headers=headers, timeout=timeout)
     result.raise_for_status()
     return result
 
-def api_put(session, host, path, body, version=1):
+def api_download_store(session, host, path, destination, version=1, timeout=None): # Throws requests error
+    """Stream a file from a store to disk and return its sha256
+
+    The file is written to destination.part and renamed when complete, so destination is never
+    left half written. A .part file left by an interrupted download is resumed with a Range request.
+    The checksum is recorded alongside in destination.sha256.
+    """
+    url = f'{api_base_url(host, version)}{path}'
+    partial = f'{destination}.part'
+
+    while True:
+        offset = os.path.getsize(partial) if os.path.isfile(partial) else 0
+        headers = {'Accept': '*/*'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        with transport.request(session, 'GET', url, headers=headers, stream=True, timeout=timeout) as result:
+            # The partial file does not match the file on the ECLYPSE, start over
+            if result.status_code == 416:
+                os.remove(partial)
+                continue
+            result.raise_for_status()
+
+            digest = hashlib.sha256()
+            if result.status_code == 206:
+                # Resume, the checksum must include the bytes already on disk
+                mode = 'ab'
+                with open(partial, 'rb') as infile:
+                    for chunk in iter(lambda: infile.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+            else:
+                # The ECLYPSE ignored the Range header and sent the whole file
+                mode = 'wb'
+
+            with open(partial, mode) as outfile:
+                for chunk in result.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    outfile.write(chunk)
+                    digest.update(chunk)
+        break
+
+    os.replace(partial, destination)
+
+    checksum = digest.hexdigest()
+    with open(f'{destination}.sha256', 'w') as outfile:
+        outfile.write(f'{checksum}  {os.path.basename(destination)}\n')
+
+    return checksum
+
+
+def api_put(session, host, path, body, version=1, timeout=None):
     """PUT to API"""
     url = f'{api_base_url(host, version)}{path}'
     headers = {'Content-type': 'application/json'}
-    result = session.put(url, json=body, headers=headers)
+    result = transport.request(session, 'PUT', url, json=body, headers=headers, timeout=timeout)
     result.raise_for_status()
     return result
 
 
-def api_delete(session, host, path, version=1):
+def api_delete(session, host, path, version=1, timeout=None):
     """Delete via API"""
     url = f'{api_base_url(host, version)}{path}'
     headers = {'Content-type': 'application/json'}
-    result = session.delete(url, headers=headers)
+    result = transport.request(session, 'DELETE', url, headers=headers, timeout=timeout)
     result.raise_for_status()
     return result
 
 
 def get_info_device(session, host):
     """Get ECLYPSE device information"""
-    return api_get(session, host, '/info/device')
+    result = api_get(session, host, '/info/device')
+    cache_info_device(host, result)
+    return result
+
+
+def cache_info_device(host, result):
+    """Record model and firmware from a device information response"""
+    try:
+        info = result.json()
+        cache.put(host, 'model', info['modelName'])
+        cache.put(host, 'firmware', info['softwareVersion'])
+    except (ValueError, KeyError, TypeError):
+        pass
 
 
 def api_version(session, host):
+    """Returns the ECY API Version, from the device cache when known"""
+    version = cache.get(host, 'api_version')
+    if version:
+        return version
+
+    version = detect_api_version(session, host)
+    if version:
+        cache.put(host, 'api_version', version)
+    return version
+
+
+def detect_api_version(session, host):
     """Returns the ECY API Version based on a successful call"""
     headers = {'accept': 'application/json'}
 
     try:
         v1_url = f'{api_base_url(host, 1)}'
-        v1_result = session.get(v1_url, headers=headers, timeout=30)
+        v1_result = transport.request(session, 'GET', v1_url, headers=headers)
         if v1_result.ok:
             return 1
 
         v2_url = f'{api_base_url(host, 2)}/services'
-        v2_result = session.get(v2_url, headers=headers, timeout=30)
+        v2_result = transport.request(session, 'GET', v2_url, headers=headers)
         if v2_result.ok:
             return 2
     except exceptions.ConnectTimeout as e:
@@ -118,7 +204,9 @@ def get_hostname(session, host):
 def set_hostname(session, host, hostname):
     method = "/system/web-server"
     data = {'hostname': hostname}
-    return api_post(session, host, method, data)
+    result = api_post(session, host, method, data)
+    cache.invalidate(host, ['device_hostname'])
+    return result
 
 
 # MSTP
@@ -196,13 +284,61 @@ def get_eclypse_firmware_version(session, host):
     return get_info_device(session, host)['softwareVersion']
 
 
-def update_eclypse_firmware(session, host, update_file):
+def update_eclypse_firmware(session, host, update_file, progress=None, limiter=None):
+    """Upload a firmware zip, update_file is a path or an upload.SharedFile shared by every host
+
+    limiter, such as rollout.TokenBucket, limits the combined upload rate of every host.
+    """
     path = "/system/update/firmware"
     url = f'{api_base_url(host)}{path}'
 
-    m = MultipartEncoder(fields={'file': (update_file, open(update_file, 'rb'), 'application/octet-stream')})
+    # The zip is streamed from memory shared with other uploads rather than read per host
+    with upload.shared(update_file) as firmware:
+        body = firmware.multipart('file', progress, limiter)
+        result = transport.request(session, 'POST', url, data=body, headers={'Content-Type': body.content_type},
+                                   timeout=transport.UPLOAD_TIMEOUT)
+
+    # Firmware and API version will change after the ECLYPSE reboots, the model and hostname do not
+    cache.invalidate(host, ['firmware', 'api_version'])
+    return result
 
-    return session.post(url, data=m, headers={'Content-Type': m.content_type})
+
+def wait_for_version(session, host, version, timeout=900, interval=10, max_interval=60):
+    """Poll device information with backoff after a firmware upload and return the version reported
+
+    Returns as soon as the ECLYPSE reports `version`. An ECLYPSE that refused connections
+    while it rebooted and came back on another version did not take the firmware, its version
+    is returned right away. Error responses and slow responses while the ECLYPSE verifies the
+    firmware are not taken as a reboot. Otherwise the last version reported is returned after
+    `timeout` seconds, or None if the ECLYPSE never answered.
+    """
+    end = time.monotonic() + timeout
+    rebooted = False
+    reported = None
+
+    while True:
+        try:
+            # Polled outside the circuit breaker, the ECLYPSE is expected to be offline while it reboots
+            result = transport.request(session, 'GET', f'{api_base_url(host)}/info/device',
+                                       headers={'accept': 'application/json'}, retries=0, use_breaker=False)
+            result.raise_for_status()
+            cache_info_device(host, result)
+            reported = result.json()['softwareVersion']
+            if reported == version or rebooted:
+                return reported
+        except exceptions.ConnectionError:
+            # No connection, the ECLYPSE is rebooting, includes ConnectTimeout
+            rebooted = True
+        except exceptions.RequestException:
+            # Still verifying the firmware, such as a 503 or a read timeout
+            pass
+
+        if time.monotonic() >= end:
+            return reported
+
+        # Back off with jitter so many ECLYPSE are not polled in lockstep
+        time.sleep(min(interval * random.uniform(0.8, 1.2), max(end - time.monotonic(), 0)))
+        interval = min(interval * 2, max_interval)
 
 
 def reboot_controller(session, host):
@@ -212,6 +348,48 @@ def reboot_controller(session, host):
     return api_post(session, host, path, data)
 
 
+# BACnet local objects
+
+class PropertyValue(NamedTuple):
+    """Result of reading one property of a local BACnet object"""
+    object_type: str
+    instance: int
+    property: str
+    value: object = None
+    error: str = None
+
+
+def get_local_property(session, host, object_type, instance, property='present-value'):
+    """Read a property of a local BACnet object, ex. analog-value 5000 present-value"""
+    method = f'/protocols/bacnet/local/objects/{object_type}/{int(instance)}/properties/{property}'
+    return api_get(session, host, method).json()['value']
+
+
+def read_local_properties(session, host, points, workers=8):
+    """Read many local object properties from one ECLYPSE concurrently
+
+    points is a list of (object_type, instance) or (object_type, instance, property) tuples,
+    property defaults to present-value. Returns a PropertyValue for every point in the same order,
+    a point that could not be read has error set instead of value. The requests share the
+    session's connection pool, so the total time is about one round trip rather than one per point.
+    A connection failure is raised rather than recorded, so sessions.session() discards the broken session.
+    """
+    points = [(point[0], int(point[1]), point[2] if len(point) > 2 else 'present-value') for point in points]
+    if not points:
+        return []
+
+    def read(point):
+        try:
+            return PropertyValue(*point, value=get_local_property(session, host, *point))
+        except exceptions.ConnectionError:
+            raise
+        except Exception as e:
+            return PropertyValue(*point, error=str(e))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(points))) as executor:
+        return list(executor.map(read, points))
+
+
 # Time
 
 def get_time(session, host):
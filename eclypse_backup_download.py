@@ -1,52 +1,53 @@
-import concurrent.futures
 import requests
 import util
+import sessions
 import argparse
 import eclypse
 import backup
+import fleet
+import sink
 
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
+# Report columns
+FIELDNAMES = ['host', 'backup_name', 'downloaded', 'file', 'size', 'stored', 'chunks', 'status']
 
 
-def download_backup(site, api_version):
+def download_backup(site, api_version, directory, store, manifest, force):
     """Download latest backup"""
     # Split input values
-    hostname, username, password = site.values()
+    hostname, username, password = site['hostname'], site['username'], site['password']
 
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # If not specified, try to determine which API is supported
+        if not api_version:
+            api_version = eclypse.api_version(session, hostname) 
 
+        # A single list call is enough when the latest backup was already downloaded
+        latest_backup = backup.latest(session, hostname, api_version=api_version)
+        if not force and backup.already_downloaded(manifest, hostname, latest_backup, store):
+            return {'host': hostname, 'backup_name': latest_backup, 'downloaded': False}
 
-        try:
-            # If not specified, try to determine which API is supported
-            if not api_version:
-                api_version = eclypse.api_version(session, hostname) 
+        # Call consolidated function
+        # The backup is streamed to a file in the directory, an interrupted download resumes on the next run
+        file_name, file_path = backup.download_backups(session, hostname, api_version=api_version,
+                                                       directory=directory, name=latest_backup)
 
-            # Call consolidated function
-            file_name, file_content = backup.download_backups(session, hostname)
-
-            # Write the backup to a file
-            with open(f'./{file_name}.zip', 'bw') as outfile:
-                outfile.write(file_content.content)
-
-            return {'host': hostname, 'backup_name': file_name, 'downloaded': file_content.ok}
-        
-        # Allow the run to continue when a single ECLYPSE returns an error
-        except requests.exceptions.ConnectTimeout:
-            print(f'host: {hostname}, status: Device did not respond')
-        except Exception as e:
-            print(f'host: {hostname}, status: {str(e)}')
+        # Recorded in the manifest, with a store only the chunks that changed are kept
+        return backup.save_download(manifest, hostname, file_name, file_path, store)
 
 
 def main():
     parser = argparse.ArgumentParser(add_help=True, description="Create an Eclypse backup")
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
     parser.add_argument('-v', '--apiversion', choices=[1,2], required=False, type=int)
+    parser.add_argument('-d', '--directory', default='.', help='Directory to save backups in')
+    parser.add_argument('-s', '--store', default=None, help='Add backups to this deduplicated backup store instead of keeping each file')
+    parser.add_argument('-f', '--force', action='store_true', help='Download the latest backup even if it was already downloaded')
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -60,18 +61,20 @@ def main():
     # hostname,username,password
     host_list = util.read_host_list(args.host_file)
 
-    # Concurrent futures manages the query of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers 
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(download_backup, site, args.apiversion) for site in host_list]
+    # Backups already on disk are skipped
+    manifest = backup.open_manifest(args.directory, args.store)
 
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
+    # With --output, each result is written to the report as it arrives
+    with sink.open_sink(args.output, FIELDNAMES) as report:
+        # The fleet runner manages the query of multiple ECLYPSE at the same time
+        # --workers determines the number of ECLYPSE worked on at once
+        for result in fleet.run(host_list, download_backup, args.apiversion, args.directory, args.store, manifest, args.force, **fleet.options(args)):
             # Output result to screen and add to report
-            if job.result() is not None:
-                print(job.result())
+            print(result.row())
+            report.write(result.row())
+
+    # Record what was downloaded for the next run
+    manifest.save()
 
 
 if __name__ == "__main__":
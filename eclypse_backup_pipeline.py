@@ -0,0 +1,86 @@
+import requests
+import util
+import sessions
+import argparse
+import eclypse
+import backup
+import fleet
+import sink
+
+# If True, do not display SSL certificate verification warnings
+SUPPRESS_SSL_WARNING = False
+# Report columns
+FIELDNAMES = ['host', 'backup_name', 'downloaded', 'file', 'size', 'stored', 'chunks', 'status']
+
+
+def backup_pipeline(site, api_version, directory, store, manifest, wait):
+    """Create a backup, wait for it to appear and download it"""
+    # Split input values
+    hostname, username, password = site['hostname'], site['username'], site['password']
+
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # If not specified, try to determine which API is supported
+        if not api_version:
+            api_version = eclypse.api_version(session, hostname)
+
+        # Remember the existing backups so the new one can be recognized
+        existing = backup.names(session, hostname, api_version=api_version)
+
+        # Schedule a full backup
+        backup.create(session, hostname, api_version=api_version)
+        print({'host': hostname, 'status': 'Backup scheduled'})
+
+        # Poll with backoff until the new backup is listed
+        backup_name = backup.wait_for_new(session, hostname, existing, api_version=api_version, timeout=wait)
+
+        # The backup is streamed to a file in the directory, an interrupted download resumes on the next run
+        file_name, file_path = backup.download_backups(session, hostname, api_version=api_version,
+                                                       directory=directory, name=backup_name)
+
+        # Recorded in the manifest, with a store only the chunks that changed are kept
+        return backup.save_download(manifest, hostname, file_name, file_path, store)
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True, description="Create, wait for and download an Eclypse backup")
+    parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
+    parser.add_argument('-v', '--apiversion', choices=[1,2], required=False, type=int)
+    parser.add_argument('-d', '--directory', default='.', help='Directory to save backups in')
+    parser.add_argument('-s', '--store', default=None, help='Add backups to this deduplicated backup store instead of keeping each file')
+    parser.add_argument('--wait', type=float, default=1800, help='Give up on a backup that has not appeared after this many seconds')
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    # Disable warning for self-signed certificate
+    if SUPPRESS_SSL_WARNING:
+        requests.packages.urllib3.disable_warnings()
+
+    # Script requires a list of ECLYPSE in a csv file
+    # The csv file should contain information for 1 ECLYPSE per line
+    # Required format is:
+    # hostname,username,password
+    host_list = util.read_host_list(args.host_file)
+
+    # Downloads are recorded so eclypse_backup_download.py will not fetch them again
+    manifest = backup.open_manifest(args.directory, args.store)
+
+    # With --output, each result is written to the report as it arrives
+    with sink.open_sink(args.output, FIELDNAMES) as report:
+        # The fleet runner manages the backup of multiple ECLYPSE at the same time
+        # Each ECLYPSE moves through create, wait and download on its own, so a slow ECLYPSE only delays itself
+        # Most of the time is spent waiting for backups, so --workers can be set well above the default
+        for result in fleet.run(host_list, backup_pipeline, args.apiversion, args.directory, args.store, manifest, args.wait, **fleet.options(args)):
+            # Output result to screen and add to report
+            print(result.row())
+            report.write(result.row())
+
+    # Record what was downloaded for the next run
+    manifest.save()
+
+
+if __name__ == "__main__":
+    main()
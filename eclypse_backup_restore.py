@@ -0,0 +1,33 @@
+import argparse
+import datetime
+import backup_store
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True, description="Rebuild an Eclypse backup file from a backup store")
+    parser.add_argument('store', help='Backup store created by eclypse_backup_download.py --store')
+    parser.add_argument('hostname', help='ECLYPSE hostname or ip address as it appears in the host list')
+    parser.add_argument('name', nargs='?', default=None, help='Backup name, defaults to the latest backup')
+    parser.add_argument('--at', default=None, help='Restore the latest backup stored at or before this date, ex. 2023-03-01T06:00')
+    parser.add_argument('--list', action='store_true', help='List the stored backups and exit')
+    parser.add_argument('-o', '--output', default=None, help='Output file, defaults to <backup name>.zip')
+
+    args = parser.parse_args()
+
+    # Display the available points in time
+    if args.list:
+        for snapshot in backup_store.snapshots(args.store, args.hostname):
+            stored = datetime.datetime.fromtimestamp(snapshot['time']).isoformat(timespec='seconds')
+            print({'host': snapshot['host'], 'backup_name': snapshot['name'], 'stored': stored, 'size': snapshot['size']})
+        return
+
+    before = datetime.datetime.fromisoformat(args.at).timestamp() if args.at else None
+    name = backup_store.find(args.store, args.hostname, args.name, before)
+
+    # Rebuild the file and verify it matches the original download
+    output = backup_store.restore(args.store, args.hostname, name, args.output or f'./{name}.zip')
+    print({'host': args.hostname, 'backup_name': name, 'file': output})
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,50 @@
-import concurrent.futures
 import requests
 import util
+import sessions
 import argparse
 import packages
 import eclypse
+import fleet
+import upload
 
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
 
 
-def upgrade(site, update_file):
+def upgrade(site, update_file, show_progress=False):
     """Upgrade APEX firmware"""
     # Split input values
-    hostname, username, password = site.values()
-
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
+    hostname, username, password = site['hostname'], site['username'], site['password']
 
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
         # Check for v2 API support
         if not eclypse.api_version(session, hostname) == 2:
             return {'host': hostname,'status': f'Unable to verify {hostname} is running BI'}
 
-        try:
-
-            # Upload new packages
-            print({'host': hostname, 'status': f"Uploading - {update_file}"})
-
-            result = packages.upload_package(session, hostname, update_file) 
+        # Upload new packages
+        print({'host': hostname, 'status': f"Uploading - {update_file.name}"})
 
-            if not result.ok:
-                return {'host': hostname,'status': result.ok}
+        progress = upload.print_progress(hostname) if show_progress else None
+        result = packages.upload_package(session, hostname, update_file, progress=progress)
 
-            # Commit new packages
-            # If upgrading OS, framework, and UI, the system will reboot    
-            result = packages.commit_all(session, hostname)
-            
+        if not result.ok:
             return {'host': hostname,'status': result.ok}
+
+        # Commit new packages
+        # If upgrading OS, framework, and UI, the system will reboot    
+        result = packages.commit_all(session, hostname)
         
-        # Allow the run to continue when a single ECLYPSE upgrade fails.
-        except requests.exceptions.HTTPError:
-            return {'host': hostname, 'status': 'Login Failed'}
-        except requests.exceptions.ConnectionError:
-            return {'host': hostname, 'status': 'Not Responding'}
+        return {'host': hostname,'status': result.ok}
 
 
 def main():
     parser = argparse.ArgumentParser(add_help=True, description="Upgrade ECLYPSE APEX Firmware")
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
     parser.add_argument('update_file', help='Zip file containing updated packages')
+    parser.add_argument('--progress', action='store_true', help='Display upload progress for each ECLYPSE')
+    fleet.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -65,18 +58,13 @@ def main():
     # hostname,username,password
     host_list = util.read_host_list(args.host_file)
 
-    # Concurrent futures manages the upgrade of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers executing upgrades
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(upgrade, site, args.update_file) for site in host_list]
-
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
+    # The package file is mapped into memory once and shared by every upload
+    with upload.SharedFile(args.update_file) as update_file:
+        # The fleet runner manages the upgrade of multiple ECLYPSE at the same time
+        # --workers determines the number of ECLYPSE upgraded at once
+        for result in fleet.run(host_list, upgrade, update_file, args.progress, **fleet.options(args)):
             # Output result to screen
-            if job.result() is not None:
-                print(job.result())
+            print(result.row())
 
 
 if __name__ == "__main__":
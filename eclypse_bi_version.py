@@ -1,9 +1,10 @@
-import concurrent.futures
 import requests
 import util
+import sessions
 import argparse
 import eclypse
 import packages
+import fleet
 
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
@@ -12,30 +13,21 @@ SUPPRESS_SSL_WARNING = False
 def firmware_version(site):
     """Retrieve firmware version"""
     # Split input values
-    hostname, username, password = site.values()
+    hostname, username, password = site['hostname'], site['username'], site['password']
 
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
-
-        try:
-            # Get current firmware version
-            for package in packages.list_packages(session, hostname).json()['packages'].values():
-                print(f"{package['version']} \t {package['description']}")
-            return 
-        # Allow the run to continue when a single ECLYPSE upgrade fails.
-        except requests.exceptions.HTTPError:
-            return {'host': hostname, 'status': 'Login Failed'}
-        except requests.exceptions.ConnectionError:
-            return {'host': hostname, 'status': 'Not Responding'}
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Get current firmware version
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        for package in packages.list_packages(session, hostname).json()['packages'].values():
+            print(f"{package['version']} \t {package['description']}")
+        return 
 
 
 def main():
     parser = argparse.ArgumentParser(add_help=True, description="Display version of installed BI packages")
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
+    fleet.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -50,18 +42,12 @@ def main():
     host_list = util.read_host_list(args.host_file)
 
 
-    # Concurrent futures manages the upgrade of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers executing upgrades
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(firmware_version, site) for site in host_list]
-
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
-            # Output result to screen
-            if job.result() is not None:
-                print(job.result())
+    # The fleet runner manages the query of multiple ECLYPSE at the same time
+    # --workers determines the number of ECLYPSE queried at once
+    for result in fleet.run(host_list, firmware_version, **fleet.options(args)):
+        # Output result to screen
+        if result.row() is not None:
+            print(result.row())
 
 
 if __name__ == "__main__":
@@ -1,8 +1,13 @@
-import concurrent.futures
 import requests
 import util
+import sessions
 import argparse
 import eclypse
+import facts
+import fleet
+import rollout
+import sink
+import upload
 
 
 # IF True, do not send an older firmware version
@@ -11,61 +16,84 @@ PREVENT_DOWNGRADE = True
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
 
+# Report columns
+FIELDNAMES = ['host', 'status']
 
-def upgrade(site, update_file, update_version):
-    """Upgrade S1000 firmware"""
+
+def upgrade(site, update_file, update_version, show_progress=False, limiter=None, verify=None, retries=1,
+            refresh=False):
+    """Upgrade S1000 firmware
+
+    With verify, wait up to verify seconds for the ECLYPSE to reboot on the new firmware
+    and upload again, up to retries times, if it comes back on the old firmware.
+    Model and firmware come from the device cache when known, unless refresh is set.
+    The downgrade check always uses the firmware read from the ECLYPSE.
+    """
     # Split input values
-    hostname, username, password = site.values()
+    hostname, username, password = site['hostname'], site['username'], site['password']
 
     # Split the upgrade version for comparrison to current firmware
     uv_major1, uv_major2, uv_minor1, uv_minor2 = update_version.split('.')
 
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
-
-        try:
-            # Get hardware version
-            # This script supports S1000 hardware only
-            # To upgrade an APEX hybrid, modify this check and supply APEX specific firmware
-            eclypse_info = eclypse.get_info_device(session, hostname).json()
-            if 'S1000' not in eclypse_info['modelName'].split(" ")[0]:
-                return {'host': hostname,
-                        'status': 'Hardware not compatible'}
-
-            # Get current firmware version
-            vr_major1, vr_major2, vr_minor1, vr_minor2 = eclypse_info['softwareVersion'].split('.')
-
-            # Skip if already upgraded
-            if eclypse_info['softwareVersion'] == update_version:
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # Get hardware version
+        # This script supports S1000 hardware only
+        # To upgrade an APEX hybrid, modify this check and supply APEX specific firmware
+        # Gathered facts skip this request, see eclypse_gather_facts.py
+        eclypse_info = facts.device_info(session, hostname, refresh)
+        if 'S1000' not in eclypse_info['modelName'].split(" ")[0]:
+            return {'host': hostname,
+                    'status': 'Hardware not compatible'}
+
+        # Skip if already upgraded
+        if eclypse_info['softwareVersion'] == update_version:
+            return {'host': hostname,
+                    'status': f"Skipping - Device is already running {eclypse_info['softwareVersion']}"}
+
+        # The cached firmware can be a day old, another tool may have changed it since
+        # Read the current firmware before deciding to upload
+        eclypse_info = eclypse.get_info_device(session, hostname).json()
+        if eclypse_info['softwareVersion'] == update_version:
+            return {'host': hostname,
+                    'status': f"Skipping - Device is already running {eclypse_info['softwareVersion']}"}
+
+        # Get current firmware version
+        vr_major1, vr_major2, vr_minor1, vr_minor2 = eclypse_info['softwareVersion'].split('.')
+
+        # Prevent downgrade
+        if PREVENT_DOWNGRADE:
+            if int(vr_major2) > int(uv_major2):
                 return {'host': hostname,
-                        'status': f"Skipping - Device is already running {eclypse_info['softwareVersion']}"}
-
-            # Prevent downgrade
-            if PREVENT_DOWNGRADE:
-                if int(vr_major2) > int(uv_major2):
-                    return {'host': hostname,
-                            'status': f"Skipping - downgrade from {eclypse_info['softwareVersion']} to {update_version}"}
+                        'status': f"Skipping - downgrade from {eclypse_info['softwareVersion']} to {update_version}"}
 
 
+        for attempt in range(retries + 1):
             # Upgrade
             print({'host': hostname, 'status': f"Uploading - {update_version}"})
 
-            result = eclypse.update_eclypse_firmware(session, hostname, update_file) 
+            progress = upload.print_progress(hostname) if show_progress else None
+            result = eclypse.update_eclypse_firmware(session, hostname, update_file, progress=progress, limiter=limiter)
 
-            if result.ok:
+            # A rejected upload is reported as an error so it counts against --max-errors
+            result.raise_for_status()
+            if not verify:
                 return {'host': hostname, 'status': f"Complete - Uploaded {eclypse_info['softwareVersion']}"}
-            
-            return {'host': hostname,'status': result.ok}
-        
-        # Allow the run to continue when a single ECLYPSE upgrade fails.
-        except requests.exceptions.HTTPError:
-            return {'host': hostname, 'status': 'Login Failed'}
-        except requests.exceptions.ConnectionError:
-            return {'host': hostname, 'status': 'Not Responding'}
+
+            # The ECLYPSE verifies the zip file and reboots to load the new firmware
+            print({'host': hostname, 'status': 'Waiting for reboot'})
+            version = eclypse.wait_for_version(session, hostname, update_version, timeout=verify)
+            if version == update_version:
+                return {'host': hostname, 'status': f"Complete - Running {update_version}"}
+
+            # Not reachable after the timeout, uploading again would not help
+            if version is None:
+                break
+            if attempt < retries:
+                print({'host': hostname, 'status': f"Retrying - Device is still running {version}"})
+
+        raise Exception(f"Upgrade failed - Device is running {version or 'unknown version'}")
 
 
 def main():
@@ -73,6 +101,17 @@ def main():
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
     parser.add_argument('update_file', help='Name of the ECLYPSE firmware zip file. ex. ECYSeries_v1.17.22053.807')
     parser.add_argument('update_version', help='Target ECLYPSE firmware version. ex. 1.17.22053.807')
+    parser.add_argument('--progress', action='store_true', help='Display upload progress for each ECLYPSE')
+    parser.add_argument('--verify', type=float, nargs='?', const=900, default=None, help='Wait up to this many seconds (default 900) for each ECLYPSE to reboot on the new firmware')
+    parser.add_argument('--retries', type=int, default=1, help='With --verify, upload again this many times if the firmware did not take (default 1)')
+    parser.add_argument('--canary', type=float, default=None, help='Upgrade this percent of ECLYPSE first, then in waves that double in size')
+    parser.add_argument('--growth', type=float, default=rollout.DEFAULT_GROWTH, help=f'Each wave is this many times larger than the last (default {rollout.DEFAULT_GROWTH})')
+    parser.add_argument('--wave-pause', type=float, default=0, help='Seconds to wait between waves')
+    parser.add_argument('--max-errors', type=float, default=None, help='Halt the rollout when more than this percent of ECLYPSE have failed')
+    parser.add_argument('--refresh', action='store_true', help='Read model and firmware from each ECLYPSE rather than the device cache')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Combined upload limit for all ECLYPSE in megabits per second')
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -86,18 +125,22 @@ def main():
     # hostname,username,password
     host_list = util.read_host_list(args.host_file)
 
-    # Concurrent futures manages the upgrade of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers executing upgrades
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(upgrade, site, args.update_file, args.update_version) for site in host_list]
-
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
-            # Output result to screen
-            if job.result() is not None:
-                print(job.result())
+    # Every upload draws from one bandwidth budget so the WAN is not saturated
+    limiter = rollout.bandwidth_limit(args.bandwidth)
+
+    # The firmware zip is mapped into memory once and shared by every upload
+    # With --output, each result is written to the report as it arrives
+    with upload.SharedFile(args.update_file) as update_file, sink.open_sink(args.output, FIELDNAMES) as report:
+        # The rollout upgrades the ECLYPSE in waves and stops if too many fail
+        # The fleet runner manages the upgrade of multiple ECLYPSE at the same time within a wave
+        # --workers determines the number of ECLYPSE upgraded at once
+        for result in rollout.run(host_list, upgrade, update_file, args.update_version, args.progress, limiter,
+                                  args.verify, args.retries, args.refresh,
+                                  canary=args.canary, growth=args.growth, max_errors=args.max_errors,
+                                  pause=args.wave_pause, **fleet.options(args)):
+            # Output result to screen and add to report
+            print(result.row())
+            report.write(result.row())
 
 
 if __name__ == "__main__":
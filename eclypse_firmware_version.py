@@ -1,41 +1,66 @@
-import concurrent.futures
+import asyncio
 import requests
 import util
+import sessions
 import argparse
-import eclypse
+import facts
+import fleet
+import aeclypse
+import sink
 
 
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
 
+# Report columns
+FIELDNAMES = ['host', 'version', 'status']
 
-def firmware_version(site):
-    """Retrieve firmware version"""
+
+def firmware_version(site, refresh=False):
+    """Retrieve firmware version, from the device cache when known"""
+    # Split input values
+    hostname, username, password = site['hostname'], site['username'], site['password']
+
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Get current firmware version
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        eclypse_info = facts.device_info(session, hostname, refresh)
+        return {'host': hostname,'version': eclypse_info['softwareVersion']}
+
+
+async def firmware_version_async(site, refresh=False):
+    """Retrieve firmware version using the async transport"""
     # Split input values
-    hostname, username, password = site.values()
-
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
-
-        try:
-            # Get current firmware version
-            eclypse_info = eclypse.get_info_device(session, hostname).json()
-            return {'host': hostname,'version': eclypse_info['softwareVersion']}
-        
-        # Allow the run to continue when a single ECLYPSE upgrade fails.
-        except requests.exceptions.HTTPError:
-            return {'host': hostname, 'status': 'Login Failed'}
-        except requests.exceptions.ConnectionError:
-            return {'host': hostname, 'status': 'Not Responding'}
+    hostname, username, password = site['hostname'], site['username'], site['password']
+
+    # Gathered facts skip the ECLYPSE entirely
+    eclypse_info = None if refresh else facts.cached_device_info(hostname)
+    if eclypse_info:
+        return {'host': hostname,'version': eclypse_info['softwareVersion']}
+
+    # Create a client to make multiple requests
+    async with aeclypse.client(username, password) as session:
+        # Get current firmware version
+        eclypse_info = (await aeclypse.get_info_device(session, hostname)).json()
+        return {'host': hostname,'version': eclypse_info['softwareVersion']}
+
+
+async def report_async(host_list, args, report):
+    """Query every ECLYPSE from a single event loop"""
+    async for result in fleet.arun(host_list, firmware_version_async, args.refresh, **fleet.options(args)):
+        # Output result to screen and add to report
+        print(result.row())
+        report.write(result.row())
 
 
 def main():
     parser = argparse.ArgumentParser(add_help=True, description="Upgrade ECLYPSE S1000 Firmware")
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
+    parser.add_argument('--refresh', action='store_true', help='Read the firmware version from each ECLYPSE rather than the device cache')
+    parser.add_argument('--asyncio', action='store_true', help='Query with the async transport, allows --workers in the thousands')
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -49,19 +74,19 @@ def main():
     # hostname,username,password
     host_list = util.read_host_list(args.host_file)
 
-
-    # Concurrent futures manages the upgrade of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers executing upgrades
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(firmware_version, site) for site in host_list]
-
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
-            # Output result to screen
-            if job.result() is not None:
-                print(job.result())
+    # With --output, each result is written to the report as it arrives
+    with sink.open_sink(args.output, FIELDNAMES) as report:
+        # Read-only sweeps are pure network wait and scale further on an event loop
+        if args.asyncio:
+            asyncio.run(report_async(host_list, args, report))
+            return
+
+        # The fleet runner manages the query of multiple ECLYPSE at the same time
+        # --workers determines the number of ECLYPSE queried at once
+        for result in fleet.run(host_list, firmware_version, args.refresh, **fleet.options(args)):
+            # Output result to screen and add to report
+            print(result.row())
+            report.write(result.row())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import requests
+import util
+import sessions
+import argparse
+import facts
+import fleet
+import inventory
+import sink
+
+
+# If True, do not display SSL certificate verification warnings
+SUPPRESS_SSL_WARNING = False
+
+# Report columns
+FIELDNAMES = ['host', *facts.FACTS, 'status']
+
+
+def gather_facts(site, refresh=False):
+    """Collect model, firmware, API version, GFX name and hostname into the device cache"""
+    # Split input values
+    hostname, username, password = site['hostname'], site['username'], site['password']
+
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # Only facts that are missing or expired are read from the ECLYPSE
+        return {'host': hostname, **facts.gather(session, hostname, refresh)}
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True, description="Gather ECLYPSE facts into the device cache")
+    parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
+    parser.add_argument('--refresh', action='store_true', help='Read every fact from the ECLYPSE, even when it is cached')
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser)
+
+    args = parser.parse_args()
+
+    # Disable warning for self-signed certificate
+    if SUPPRESS_SSL_WARNING:
+        requests.packages.urllib3.disable_warnings()
+
+    # Script requires a list of ECLYPSE in a csv file
+    # The csv file should contain information for 1 ECLYPSE per line
+    # Required format is:
+    # hostname,username,password
+    host_list = util.read_host_list(args.host_file)
+
+    # With --output, each result is written to the report as it arrives
+    with sink.open_sink(args.output, FIELDNAMES) as report:
+        # The fleet runner manages the query of multiple ECLYPSE at the same time
+        # --workers determines the number of ECLYPSE queried at once
+        for result in fleet.run(host_list, gather_facts, args.refresh, **fleet.options(args)):
+            # Output result to screen and add to report
+            print(result.row())
+            report.write(result.row())
+
+            # Keep the model and firmware columns of an inventory database current for --where
+            if result.ok and inventory.is_database(args.host_file):
+                inventory.update(result.host, args.host_file,
+                                 model=result.value['model'], firmware=result.value['firmware'])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,46 @@
-import concurrent.futures
 import requests
 import util
+import sessions
 import argparse
 import gfx
 import eclypse
+import fleet
+import sink
 
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
 
+# Report columns
+FIELDNAMES = ['host', 'version', 'lastModified', 'status']
 
-def gfx_version(site, api_version):
+
+def gfx_version(site, api_version, use_cache):
     """Retrieve GFX Project Name"""
     # Split input values
-    hostname, username, password = site.values()
-
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
-
-
+    hostname, username, password = site['hostname'], site['username'], site['password']
 
-        try:
-            # If not specified, try to determine which API is supported
-            if not api_version:
-                api_version = eclypse.api_version(session, hostname) 
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # If not specified, try to determine which API is supported
+        if not api_version:
+            api_version = eclypse.api_version(session, hostname) 
 
-            # Call consolidated function
-            # If specified, it will attempt to get the gfx name using the v1 or v2 API
-            # If unknown, it will attempt both 
-            version = gfx.get_project_name(session, hostname, version=api_version)
-            lastModified = gfx.get_project_lastModified(session, hostname, version=api_version)
-            return {'host': hostname,'version': version, 'lastModified': lastModified}
-        
-        # Allow the run to continue when a single ECLYPSE returns an error
-        except requests.exceptions.ConnectTimeout:
-            return {'host': hostname, 'status': 'Device did not respond'}
-        except Exception as e:
-            return {'host': hostname, 'status': str(e)}
+        # Call consolidated function
+        # If specified, it will attempt to get the gfx name using the v1 or v2 API
+        # If unknown, it will attempt both 
+        # Name and date come from a single download, skipped when the cached project is unchanged
+        project = gfx.get_project_info(session, hostname, version=api_version, use_cache=use_cache)
+        return {'host': hostname,'version': project['name'], 'lastModified': project['lastModified']}
 
 
 def main():
     parser = argparse.ArgumentParser(add_help=True, description="Report GFX Version")
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
     parser.add_argument('-v', '--apiversion', choices=[1,2], required=False, type=int)
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='Always download the GFX project')
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser, report=True)
 
     args = parser.parse_args()
     print(args)
@@ -60,28 +55,14 @@ def main():
     # hostname,username,password
     host_list = util.read_host_list(args.host_file)
 
-    # List to hold results for report
-    report = []
-
-    # Concurrent futures manages the query of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers 
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(gfx_version, site, args.apiversion) for site in host_list]
-
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
-            # Output result to screen
-            if job.result() is not None:
-                print(job.result())
-
-            # Add results with data to the report
-            if not 'status' in job.result().keys():
-                report.append(job.result())
-
-    # Write CSV report
-    util.to_csv(report)
+    # Each result is written to the report as it arrives, failed ECLYPSE have a status
+    with sink.open_sink(args.output, FIELDNAMES) as report:
+        # The fleet runner manages the query of multiple ECLYPSE at the same time
+        # --workers determines the number of ECLYPSE worked on at once
+        for result in fleet.run(host_list, gfx_version, args.apiversion, args.use_cache, **fleet.options(args)):
+            # Output result to screen and add to report
+            print(result.row())
+            report.write(result.row())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,130 @@
+import requests
+import util
+import sessions
+import argparse
+import eclypse
+import facts
+import accounts
+import backup
+import gfx
+import packages
+import fleet
+import sink
+
+# If True, do not display SSL certificate verification warnings
+SUPPRESS_SSL_WARNING = False
+
+
+# Operations available to a playbook
+# Each operation receives an open session and returns columns for the combined report
+
+
+def firmware(session, hostname, api_version):
+    """Hardware model and firmware version"""
+    eclypse_info = facts.device_info(session, hostname)
+    return {'model': eclypse_info['modelName'], 'version': eclypse_info['softwareVersion']}
+
+
+def gfx_project(session, hostname, api_version):
+    """Name and date of the installed GFX project"""
+    project = gfx.get_project_info(session, hostname, version=api_version)
+    return {'gfx': project['name'], 'gfx_modified': project['lastModified']}
+
+
+def users(session, hostname, api_version):
+    """Local users"""
+    return {'users': ';'.join(accounts.get_users(session, hostname, api_version=api_version))}
+
+
+def backups(session, hostname, api_version):
+    """Number of backups and the latest backup"""
+    found = backup.names(session, hostname, api_version=api_version)
+    return {'backups': len(found), 'latest_backup': max(found) if found else ''}
+
+
+def bi_packages(session, hostname, api_version):
+    """Installed BI packages, ECLYPSE API v2 only"""
+    if api_version != 2:
+        return {'packages': 'Not supported'}
+
+    installed = packages.list_packages(session, hostname).json()['packages'].values()
+    return {'packages': ';'.join(f"{package['description']} {package['version']}" for package in installed)}
+
+
+# Operation name: (function, report columns)
+OPERATIONS = {
+    'firmware': (firmware, ['model', 'version']),
+    'gfx': (gfx_project, ['gfx', 'gfx_modified']),
+    'users': (users, ['users']),
+    'backups': (backups, ['backups', 'latest_backup']),
+    'packages': (bi_packages, ['packages']),
+}
+
+
+def run_playbook(site, operations, api_version):
+    """Run every operation in order on one ECLYPSE and return a single report row"""
+    # Split input values
+    hostname, username, password = site['hostname'], site['username'], site['password']
+    row = {'host': hostname}
+    failed = []
+
+    # Every operation shares one session, so the ECLYPSE is connected to once
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # The API version is detected once and used by every operation
+        if not api_version:
+            api_version = eclypse.api_version(session, hostname)
+
+        for name in operations:
+            function, _ = OPERATIONS[name]
+            try:
+                row.update(function(session, hostname, api_version))
+            except requests.exceptions.ConnectionError:
+                # The ECLYPSE is gone, the remaining operations would fail the same way
+                raise
+            except Exception as e:
+                # Other failures only affect this operation
+                failed.append(f'{name}: {fleet.describe_error(e)}')
+
+    row['status'] = '; '.join(failed) if failed else 'OK'
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True, description="Run several operations on every Eclypse and write a single report")
+    parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
+    parser.add_argument('operations', nargs='+', choices=list(OPERATIONS), help='Operations to run on each ECLYPSE, in order')
+    parser.add_argument('-v', '--apiversion', choices=[1,2], required=False, type=int)
+    fleet.add_arguments(parser)
+    sink.add_arguments(parser, report=True)
+
+    args = parser.parse_args()
+
+    # Disable warning for self-signed certificate
+    if SUPPRESS_SSL_WARNING:
+        requests.packages.urllib3.disable_warnings()
+
+    # Script requires a list of ECLYPSE in a csv file
+    # The csv file should contain information for 1 ECLYPSE per line
+    # Required format is:
+    # hostname,username,password
+    host_list = util.read_host_list(args.host_file)
+
+    # Report columns follow the order of the operations
+    fieldnames = ['host']
+    for name in args.operations:
+        fieldnames += OPERATIONS[name][1]
+    fieldnames.append('status')
+
+    # Each result is written to the report as it arrives
+    with sink.open_sink(args.output, fieldnames) as report:
+        # The fleet runner manages the query of multiple ECLYPSE at the same time
+        # --workers determines the number of ECLYPSE worked on at once
+        for result in fleet.run(host_list, run_playbook, args.operations, args.apiversion, **fleet.options(args)):
+            # Output result to screen and add to report
+            print(result.row())
+            report.write(result.row())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import concurrent.futures
+import csv
+import heapq
+import random
+import time
+import requests
+import util
+import sessions
+import argparse
+import eclypse
+import fleet
+import sink
+
+# If True, do not display SSL certificate verification warnings
+SUPPRESS_SSL_WARNING = False
+
+# Column types accepted in the point list, used for Parquet output
+COLUMN_TYPES = ('float64', 'int64', 'bool', 'string')
+
+
+def column_type(object_type, property):
+    """Column type of a point without a type in the point list"""
+    if property != 'present-value':
+        return 'string'
+    if object_type.startswith('analog'):
+        return 'float64'
+    if object_type.startswith('binary'):
+        return 'bool'
+    # Multistate and other values are kept as they are read, such as state text
+    return 'string'
+
+
+def read_point_list(point_file):
+    """Parse point list, one point per line: object type,instance[,property[,column name[,type]]]"""
+    points = []
+    with open(point_file) as csvfile:
+        for line in csv.reader(csvfile):
+            if not line or line[0].startswith('#'):
+                continue
+
+            object_type, instance = line[0].strip(), int(line[1])
+            property = line[2].strip() if len(line) > 2 and line[2].strip() else 'present-value'
+            name = line[3].strip() if len(line) > 3 and line[3].strip() else f'{object_type}:{instance}:{property}'
+            point_type = line[4].strip() if len(line) > 4 and line[4].strip() else column_type(object_type, property)
+            if point_type not in COLUMN_TYPES:
+                raise Exception(f"Unknown type '{point_type}' for {name}, expected one of {', '.join(COLUMN_TYPES)}")
+            points.append({'point': (object_type, instance, property), 'name': name, 'type': point_type})
+    return points
+
+
+def poll(site, points):
+    """Read every point from one ECLYPSE and return a row with a column per point"""
+    hostname = site['hostname']
+    row = {'time': time.time(), 'host': hostname}
+
+    # Reuse the open session for this ECLYPSE, connections stay open between samples
+    with sessions.session(hostname, site['username'], site['password']) as session:
+        values = eclypse.read_local_properties(session, hostname, [point['point'] for point in points])
+    for point, value in zip(points, values):
+        row[point['name']] = value.value
+
+    # Report the ECLYPSE as failed if no point could be read
+    if values and all(value.error for value in values):
+        raise Exception(values[0].error)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=True, description="Sample BACnet points from every Eclypse on a schedule")
+    parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
+    parser.add_argument('point_file', help='List of points, one per line: object type,instance[,property[,column name[,type]]]')
+    parser.add_argument('-i', '--interval', type=float, default=60, help='Seconds between samples of each ECLYPSE (default 60)')
+    parser.add_argument('-j', '--jitter', type=float, default=0.1, help='Randomly vary each interval by this fraction to spread the load (default 0.1)')
+    parser.add_argument('-c', '--count', type=int, default=0, help='Number of samples per ECLYPSE, 0 to run until interrupted')
+    parser.add_argument('-w', '--workers', type=int, default=fleet.DEFAULT_WORKERS, help='Number of ECLYPSE to sample at the same time')
+    sink.add_arguments(parser, report=True)
+
+    args = parser.parse_args()
+
+    # Disable warning for self-signed certificate
+    if SUPPRESS_SSL_WARNING:
+        requests.packages.urllib3.disable_warnings()
+
+    # Script requires a list of ECLYPSE in a csv file
+    # The csv file should contain information for 1 ECLYPSE per line
+    # Required format is:
+    # hostname,username,password
+    host_list = list(util.read_host_list(args.host_file))
+    points = read_point_list(args.point_file)
+    if not points:
+        parser.error(f'No points in {args.point_file}')
+
+    # Connections stay open between samples, so each sample costs one round trip instead of a new TLS handshake
+    # Only sessions.MAX_SESSIONS ECLYPSE keep their connections open at once, larger host lists reconnect
+    # the least recently sampled ECLYPSE so the process stays within its open file limit
+
+    # Every sample is written as it arrives, one column per point
+    fieldnames = ['time', 'host'] + [point['name'] for point in points]
+    types = {'time': 'float64', **{point['name']: point['type'] for point in points}}
+
+    # Spread the first samples across the interval so the ECLYPSE are not all polled at once
+    start = time.monotonic()
+    schedule = [(start + random.uniform(0, args.interval), index) for index in range(len(host_list))]
+    heapq.heapify(schedule)
+    samples = [0] * len(host_list)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+    running = {}
+    try:
+        with sink.open_sink(args.output, fieldnames, types) as outfile:
+            while schedule or running:
+                # Start every ECLYPSE that is due
+                while schedule and schedule[0][0] <= time.monotonic() and len(running) < args.workers:
+                    due, index = heapq.heappop(schedule)
+                    site = host_list[index]
+                    job = executor.submit(poll, site, points)
+                    running[job] = (due, index)
+
+                wait = max(schedule[0][0] - time.monotonic(), 0) if schedule and len(running) < args.workers else None
+                done, _ = concurrent.futures.wait(running, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for job in done:
+                    due, index = running.pop(job)
+                    try:
+                        outfile.write(job.result())
+                    except Exception as e:
+                        print({'host': host_list[index]['hostname'], 'status': fleet.describe_error(e)})
+
+                    # Schedule the next sample
+                    samples[index] += 1
+                    if not args.count or samples[index] < args.count:
+                        interval = args.interval * random.uniform(1 - args.jitter, 1 + args.jitter)
+                        heapq.heappush(schedule, (max(due + interval, time.monotonic()), index))
+
+    except KeyboardInterrupt:
+        # Stop collecting, the output file is closed above so it remains readable
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        sessions.close_all()
+
+    print({'output': args.output, 'samples': sum(samples)})
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
-import concurrent.futures
 import requests
 import util
+import sessions
 import argparse
 import eclypse
 import accounts
+import fleet
 
 # If True, do not display SSL certificate verification warnings
 SUPPRESS_SSL_WARNING = False
@@ -12,29 +13,18 @@ SUPPRESS_SSL_WARNING = False
 def change_password(site, new_username, new_password, api_version):
     """Change password"""
     # Split input values
-    hostname, username, password = site.values()
+    hostname, username, password = site['hostname'], site['username'], site['password']
 
-    # Create a session to make multiple requests
-    with requests.session() as session:
-        # ECLYPSE local API requires HTTP basic authentiation
-        session.auth = (username,password)
-        # Disable SSL certificate verification when using default self-signed certificate
-        session.verify = False
+    # Reuse the open session for this ECLYPSE, connections stay open between requests and tasks
+    with sessions.session(hostname, username, password) as session:
+        # Errors are reported by the fleet runner so the run continues when a single ECLYPSE fails
+        # If not specified, try to determine which API is supported
+        if not api_version:
+            api_version = eclypse.api_version(session, hostname) 
 
-        try:
-            # If not specified, try to determine which API is supported
-            if not api_version:
-                api_version = eclypse.api_version(session, hostname) 
-
-            # Call consolidated function
-            results = accounts.set_password(session, hostname, new_username, new_password)
-            return {'host': hostname, 'user': new_username, 'changed': results.ok}
-        
-        # Allow the run to continue when a single ECLYPSE returns an error
-        except requests.exceptions.ConnectTimeout:
-            print(f'host: {hostname}, status: Device did not respond')
-        except Exception as e:
-            print(f'host: {hostname}, status: {str(e)}')
+        # Call consolidated function
+        results = accounts.set_password(session, hostname, new_username, new_password, api_version=api_version)
+        return {'host': hostname, 'user': new_username, 'changed': results.ok}
 
 
 def main():
@@ -43,6 +33,7 @@ def main():
     parser.add_argument('new_password', help='New Password')
     parser.add_argument('host_file', default='./host_file', help='List of ECLYPSE controllers')
     parser.add_argument('-v', '--apiversion', choices=[1,2], required=False, type=int, help='Only attempt specified version')
+    fleet.add_arguments(parser)
 
     args = parser.parse_args()
 
@@ -56,18 +47,11 @@ def main():
     # hostname,username,password
     host_list = util.read_host_list(args.host_file)
 
-    # Concurrent futures manages the query of multiple ECLYPSE at the same time
-    # max_workers determines the number of workers 
-    # increase max_workers to decrease runtime
-    # decrease max_workers to reduce CPU and bandwidth consumption
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        jobs = [executor.submit(change_password, site, args.new_username, args.new_password, args.apiversion) for site in host_list]
-
-        # Record result as each worker completes an upgrade job
-        for job in concurrent.futures.as_completed(jobs):
-            # Output result to screen
-            if job.result() is not None:
-                print(job.result())
+    # The fleet runner manages the query of multiple ECLYPSE at the same time
+    # --workers determines the number of ECLYPSE worked on at once
+    for result in fleet.run(host_list, change_password, args.new_username, args.new_password, args.apiversion, **fleet.options(args)):
+        # Output result to screen
+        print(result.row())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+import cache
+import eclypse
+import gfx
+
+
+# Facts about each ECLYPSE, gathered once and shared by every script
+# Facts are kept in the device cache, each is trusted for its own time set in cache.TTLS.
+# Scripts read a fact from the cache and only ask the ECLYPSE when it is missing or expired,
+# eclypse_gather_facts.py collects every fact ahead of time so later runs skip those requests.
+
+FACTS = ['model', 'firmware', 'api_version', 'gfx_name', 'device_hostname']
+
+
+def get(host, name):
+    """Return a cached fact, or None if unknown or expired"""
+    return cache.get(host, name)
+
+
+def cached(host):
+    """Return every fact known for an ECLYPSE, expired facts are None"""
+    return {name: get(host, name) for name in FACTS}
+
+
+def cached_device_info(host):
+    """Return model and firmware in the form of a device information response, or None unless both are cached"""
+    model, firmware = get(host, 'model'), get(host, 'firmware')
+    if model is None or firmware is None:
+        return None
+    return {'modelName': model, 'softwareVersion': firmware}
+
+
+def device_info(session, host, refresh=False):
+    """Return model and firmware, only asking the ECLYPSE when they are not cached"""
+    info = None if refresh else cached_device_info(host)
+    if info is None:
+        # Recorded in the cache by get_info_device
+        info = eclypse.get_info_device(session, host).json()
+    return info
+
+
+def device_hostname(session, host, refresh=False):
+    """Return the hostname set on the ECLYPSE"""
+    name = None if refresh else get(host, 'device_hostname')
+    if name is None:
+        name = eclypse.get_hostname(session, host).json().get('hostname')
+        cache.put(host, 'device_hostname', name)
+    return name
+
+
+def gfx_name(session, host, api_version=None, refresh=False):
+    """Return the name of the installed GFX project"""
+    name = None if refresh else get(host, 'gfx_name')
+    if name is None:
+        # Recorded in the cache by get_project_info
+        name = gfx.get_project_info(session, host, version=api_version)['name']
+    return name
+
+
+def gather(session, host, refresh=False):
+    """Collect every fact about an ECLYPSE, asking only for facts that are missing or expired
+
+    With refresh, every fact is read from the ECLYPSE again.
+    """
+    if refresh:
+        cache.invalidate(host, FACTS)
+
+    info = device_info(session, host)
+    api_version = eclypse.api_version(session, host)
+    try:
+        project = gfx_name(session, host, api_version)
+    except Exception:
+        # An ECLYPSE without a GFX project loaded
+        project = None
+
+    return {'model': info['modelName'],
+            'firmware': info['softwareVersion'],
+            'api_version': api_version,
+            'gfx_name': project,
+            'device_hostname': device_hostname(session, host)}
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,483 @@
+import asyncio
+import collections
+import concurrent.futures
+import ipaddress
+import time
+from dataclasses import dataclass
+from requests import exceptions
+import journal as run_journal
+import query
+import prescan as tcp_prescan
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+# Number of ECLYPSE worked on at the same time
+# increase workers to decrease runtime
+# decrease workers to reduce CPU and bandwidth consumption
+DEFAULT_WORKERS = 10
+
+# Adaptive concurrency starts this low and grows towards --workers while ECLYPSE respond well
+ADAPTIVE_START = 4
+# A task slower than this multiple of its site's usual time is a sign the site is overloaded
+LATENCY_TOLERANCE = 3.0
+# Weight of the newest task time in a site's usual time
+LATENCY_WEIGHT = 0.2
+# ECLYPSE without a site in the host list are grouped by subnet of this prefix length
+DEFAULT_SUBNET = 24
+# Hosts read ahead of a full site, per worker, while looking for a host that can start
+HOLD_FACTOR = 4
+# Status of hosts that did not accept a connection during --prescan
+PRESCAN_ERROR = 'Not Responding - no connection during prescan'
+
+
+@dataclass
+class Result:
+    """Outcome of a task on a single ECLYPSE"""
+    host: str
+    value: object = None
+    error: str = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        """True when the task returned without an error"""
+        return self.error is None
+
+    def row(self):
+        """Return the task value, or a status row when the task failed"""
+        if self.ok:
+            return self.value
+        return {'host': self.host, 'status': self.error}
+
+
+def describe_error(e):
+    """Convert an exception raised by a task into a short status message"""
+    if isinstance(e, exceptions.ConnectTimeout):
+        return 'Device did not respond'
+    if isinstance(e, exceptions.HTTPError):
+        if e.response is not None and e.response.status_code in (401, 403):
+            return 'Login Failed'
+        return str(e)
+    if isinstance(e, exceptions.ConnectionError):
+        return 'Not Responding'
+
+    # Errors raised by the async transport
+    if httpx:
+        if isinstance(e, httpx.ConnectTimeout):
+            return 'Device did not respond'
+        if isinstance(e, httpx.HTTPStatusError):
+            if e.response.status_code in (401, 403):
+                return 'Login Failed'
+            return str(e)
+        if isinstance(e, httpx.TransportError):
+            return 'Not Responding'
+    return str(e)
+
+
+def is_congestion(e):
+    """True if an exception suggests the network or the ECLYPSE is overloaded"""
+    if isinstance(e, (exceptions.ConnectionError, exceptions.Timeout)):
+        return True
+    if httpx and isinstance(e, httpx.TransportError):
+        return True
+    return False
+
+
+def site_key(site, subnet=DEFAULT_SUBNET):
+    """Return the group an ECLYPSE belongs to for the per site limit
+
+    The site column of the host list is used when present, otherwise the subnet of the address.
+    Hostnames that are not IP addresses are their own group.
+    """
+    if site.get('site'):
+        return site['site']
+
+    address = site['hostname']
+    # Remove a port number, IPv6 addresses contain more than one colon
+    if address.count(':') == 1:
+        address = address.split(':')[0]
+    try:
+        ip = ipaddress.ip_address(address.strip('[]'))
+    except ValueError:
+        return address
+    # IPv6 sites are normally a /64
+    return str(ipaddress.ip_network(f'{ip}/{subnet if ip.version == 4 else 64}', strict=False))
+
+
+class AdaptiveLimit:
+    """Concurrency limit that grows while tasks go well and halves when they do not
+
+    Additive increase, multiplicative decrease: every good result adds about one worker per
+    round of tasks, a connection failure, timeout, or a task much slower than usual for its
+    site halves the limit. Tasks started before the last decrease cannot decrease it again,
+    so a single burst of failures only halves the limit once.
+    """
+
+    def __init__(self, maximum, start=ADAPTIVE_START, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(max(min(start, maximum), minimum))
+        self.usual = {}
+        self.decreased = 0.0
+
+    def __int__(self):
+        return int(self.limit)
+
+    def update(self, key, started, elapsed, congested):
+        """Adjust the limit after a task on a host in group `key` has finished"""
+        usual = self.usual.get(key)
+        slow = usual is not None and elapsed > usual * LATENCY_TOLERANCE
+        if not congested:
+            self.usual[key] = elapsed if usual is None else usual + LATENCY_WEIGHT * (elapsed - usual)
+
+        if congested or slow:
+            if started >= self.decreased:
+                self.limit = max(self.limit / 2, self.minimum)
+                self.decreased = time.monotonic()
+        else:
+            self.limit = min(self.limit + 1 / self.limit, self.maximum)
+
+
+class Scheduler:
+    """Chooses the next host to start within the worker limit and the per site limit"""
+
+    def __init__(self, hosts, workers=DEFAULT_WORKERS, adaptive=False, per_site=None, subnet=DEFAULT_SUBNET,
+                 stop=None):
+        self.hosts = iter(hosts)
+        # Returns the status of hosts that will not be started once the run should stop
+        self.stop = stop
+        self.workers = workers
+        self.limit = AdaptiveLimit(workers) if adaptive else None
+        self.per_site = per_site
+        self.subnet = subnet
+        # Hosts read from the host list while their site was full
+        self.held = collections.deque()
+        self.active = collections.Counter()
+        self.running = 0
+
+    def capacity(self):
+        """Number of hosts allowed to run at the same time right now"""
+        return int(self.limit) if self.limit else self.workers
+
+    def _fits(self, site):
+        return not self.per_site or self.active[site_key(site, self.subnet)] < self.per_site
+
+    def _start(self, site):
+        self.active[site_key(site, self.subnet)] += 1
+        self.running += 1
+        return site
+
+    def next(self):
+        """Return the next host that can start now, or None"""
+        if self.running >= self.capacity() or self.stopped():
+            return None
+
+        for index, site in enumerate(self.held):
+            if self._fits(site):
+                del self.held[index]
+                return self._start(site)
+
+        # Read past hosts whose site is full, bounded so the host list is still read lazily
+        while len(self.held) < self.workers * HOLD_FACTOR:
+            site = next(self.hosts, None)
+            if site is None:
+                return None
+            if self._fits(site):
+                return self._start(site)
+            self.held.append(site)
+        return None
+
+    def finished(self, site, started, elapsed, congested=False):
+        """Release a host's place and let the adaptive limit learn from it"""
+        key = site_key(site, self.subnet)
+        self.active[key] -= 1
+        self.running -= 1
+        if self.limit:
+            self.limit.update(key, started, elapsed, congested)
+
+    def stopped(self):
+        """Status of the hosts left when the run was stopped, or None while it continues"""
+        return self.stop() if self.stop else None
+
+    def waiting(self):
+        """True if any host is left to start, reads one host ahead to find out"""
+        if not self.held:
+            site = next(self.hosts, None)
+            if site is None:
+                return False
+            self.held.append(site)
+        return True
+
+    def remaining(self):
+        """Yield every host that was never started"""
+        while self.held:
+            yield self.held.popleft()
+        yield from self.hosts
+
+
+def add_arguments(parser):
+    """Add the fleet runner options to a script's argument parser"""
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Number of ECLYPSE to work on at the same time (default {DEFAULT_WORKERS})')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Give up on a single ECLYPSE after this many seconds')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='Stop starting new ECLYPSE after this many seconds and report the rest')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Start with a few ECLYPSE at a time and adjust up to --workers as they respond')
+    parser.add_argument('--per-site', type=int, default=None,
+                        help='Number of ECLYPSE to work on at the same time at a single site')
+    parser.add_argument('--prescan', action='store_true',
+                        help='Check every ECLYPSE answers on port 443 first and report the others as not responding right away')
+    parser.add_argument('--resume', metavar='RUN_ID', default=None,
+                        help='Continue an interrupted run, only ECLYPSE that did not finish or failed are worked on')
+    parser.add_argument('--subnet', type=int, default=DEFAULT_SUBNET,
+                        help=f'ECLYPSE without a site in the host list are grouped by subnet of this prefix length (default {DEFAULT_SUBNET})')
+    parser.add_argument('--where', nargs='+', action='extend', type=query.condition, metavar='EXPRESSION', default=None,
+                        help='Only work on ECLYPSE matching every expression, such as model=S1000 firmware<1.18 site~east*')
+    parser.add_argument('--sample', type=query.sample_size, metavar='COUNT', default=None,
+                        help='Only work on a random sample of the matching ECLYPSE, a number of ECLYPSE or a percentage such as 5%%')
+
+
+def options(args):
+    """Return the fleet runner keyword arguments from parsed command line arguments"""
+    return {'workers': args.workers, 'timeout': args.timeout, 'deadline': args.deadline,
+            'adaptive': args.adaptive, 'per_site': args.per_site, 'subnet': args.subnet, 'prescan': args.prescan,
+            'where': args.where, 'sample': args.sample,
+            'journal': run_journal.Journal(args.resume, host_file=getattr(args, 'host_file', None))}
+
+
+def _timed(task, site, args, started):
+    """Run a task and measure how long it took
+
+    The start time is recorded in the `started` dictionary when the thread begins the task,
+    only then does the per host timeout apply.
+    """
+    start = started['time'] = time.monotonic()
+    try:
+        return task(site, *args), None, time.monotonic() - start, False
+    except Exception as e:
+        return None, describe_error(e), time.monotonic() - start, is_congestion(e)
+
+
+def _next_expiry(running, timeout, run_end):
+    """Seconds until the next host times out or the deadline passes, None to wait for a result"""
+    expiries = [started['time'] + timeout for _, started in running.values() if 'time' in started] if timeout else []
+    if run_end:
+        expiries.append(run_end)
+    if not expiries:
+        return None
+    return max(min(expiries) - time.monotonic(), 0)
+
+
+def select(hosts, where=None, sample=None, journal=None):
+    """Choose the hosts of a run, or the hosts chosen when a resumed run started"""
+    if journal and journal.selected is not None:
+        return (site for site in hosts if site['hostname'] in journal.selected)
+
+    hosts = query.select(hosts, where, sample)
+    if journal and (where or sample):
+        hosts = journal.select(hosts)
+    return hosts
+
+
+def run(hosts, task, *args, where=None, sample=None, journal=None, **options):
+    """Run task(site, *args) for every host and yield a Result as each one completes
+
+    hosts is any iterable of host dictionaries, such as util.read_host_list().
+    Hosts are read lazily so only `workers` tasks are queued at any time.
+    A host that runs longer than `timeout` from the moment its task starts is reported as timed
+    out and no longer waited on, its place is only given to another host when the underlying
+    request returns.
+    Once `deadline` seconds have passed, no new hosts are started and every remaining host
+    is reported as skipped.
+    With `adaptive`, the number of hosts worked on at once starts low and follows how well
+    they respond, up to `workers`. `per_site` limits the hosts worked on at once in a single
+    site, taken from the host list or the subnet of the address.
+    With `prescan`, hosts that do not accept a connection are reported before any task starts.
+    `stop` is called before each host starts, once it returns a status no more hosts are
+    started and every remaining host is reported with that status.
+    Only hosts matching every `where` expression are worked on, see query.py, and `sample`
+    picks a random number or percentage of them. The chosen hosts are recorded in the journal,
+    a resumed run works on the same hosts rather than choosing again.
+    With a `journal`, every result is recorded and hosts completed in an earlier attempt at
+    the same run are not started again.
+    """
+    hosts = select(hosts, where, sample, journal)
+    if journal:
+        hosts = journal.pending(hosts)
+
+    try:
+        for result in _run(hosts, task, *args, **options):
+            if journal:
+                journal.record(result)
+            yield result
+    finally:
+        if journal:
+            journal.close()
+
+
+def _run(hosts, task, *args, workers=DEFAULT_WORKERS, timeout=None, deadline=None,
+         adaptive=False, per_site=None, subnet=DEFAULT_SUBNET, prescan=False, stop=None):
+    run_end = time.monotonic() + deadline if deadline else None
+    if prescan:
+        hosts, offline = tcp_prescan.split(hosts)
+        for site in offline:
+            yield Result(site['hostname'], error=PRESCAN_ERROR)
+
+    scheduler = Scheduler(hosts, workers, adaptive, per_site, subnet, stop)
+    running = {}
+    # Hosts reported as timed out keep their place until their thread returns,
+    # so new hosts never queue behind a hung thread
+    abandoned = {}
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # Keep the pool full while the deadline allows it
+            while not (run_end and time.monotonic() >= run_end):
+                site = scheduler.next()
+                if site is None:
+                    break
+                started = {}
+                running[executor.submit(_timed, task, site, args, started)] = (site, started)
+
+            if not running:
+                # Wait for an abandoned thread only when a host is waiting for its place
+                if (not abandoned or (run_end and time.monotonic() >= run_end) or scheduler.stopped()
+                        or not scheduler.waiting()):
+                    break
+
+            done, _ = concurrent.futures.wait([*running, *abandoned],
+                                              timeout=_next_expiry(running, timeout, run_end),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for job in done:
+                if job in abandoned:
+                    # Already reported as timed out, release its place
+                    site, started = abandoned.pop(job)
+                    _, _, elapsed, _ = job.result()
+                    scheduler.finished(site, started['time'], elapsed, congested=True)
+                    continue
+
+                site, started = running.pop(job)
+                value, error, elapsed, congested = job.result()
+                scheduler.finished(site, started['time'], elapsed, congested)
+                yield Result(site['hostname'], value, error, elapsed)
+
+            # Abandon hosts that ran past the per host timeout or the global deadline
+            now = time.monotonic()
+            for job, (site, started) in list(running.items()):
+                if 'time' not in started:
+                    # Not started by a thread yet, a host is never reported as timed out before it runs
+                    if run_end and now >= run_end and job.cancel():
+                        running.pop(job)
+                        scheduler.finished(site, now, 0)
+                        yield Result(site['hostname'], error='Skipped - deadline reached')
+                    continue
+
+                elapsed = now - started['time']
+                if timeout and elapsed >= timeout:
+                    abandoned[job] = running.pop(job)
+                    yield Result(site['hostname'], error='Timed out', elapsed=elapsed)
+                elif run_end and now >= run_end:
+                    abandoned[job] = running.pop(job)
+                    yield Result(site['hostname'], error='Timed out - deadline reached', elapsed=elapsed)
+
+        # Report every host that was never started
+        status = scheduler.stopped() or 'Skipped - deadline reached'
+        for site in scheduler.remaining():
+            yield Result(site['hostname'], error=status)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+
+async def _atimed(task, site, args, timeout):
+    """Await a task with an optional timeout and measure how long it took"""
+    start = time.monotonic()
+    try:
+        return await asyncio.wait_for(task(site, *args), timeout), None, time.monotonic() - start, False
+    except asyncio.TimeoutError:
+        return None, 'Timed out', time.monotonic() - start, True
+    except Exception as e:
+        return None, describe_error(e), time.monotonic() - start, is_congestion(e)
+
+
+async def arun(hosts, task, *args, where=None, sample=None, journal=None, **options):
+    """Await task(site, *args) for every host and yield a Result as each one completes
+
+    Async version of run() for coroutine tasks, such as those built on aeclypse.
+    A single event loop can keep far more ECLYPSE in flight than a thread pool,
+    so `workers` can be set in the thousands for read-only sweeps.
+    Timed out hosts are cancelled rather than abandoned.
+    """
+    hosts = select(hosts, where, sample, journal)
+    if journal:
+        hosts = journal.pending(hosts)
+
+    try:
+        async for result in _arun(hosts, task, *args, **options):
+            if journal:
+                journal.record(result)
+            yield result
+    finally:
+        if journal:
+            journal.close()
+
+
+async def _arun(hosts, task, *args, workers=DEFAULT_WORKERS, timeout=None, deadline=None,
+                adaptive=False, per_site=None, subnet=DEFAULT_SUBNET, prescan=False, stop=None):
+    run_end = time.monotonic() + deadline if deadline else None
+    if prescan:
+        hosts, offline = await tcp_prescan.scan(hosts)
+        for site in offline:
+            yield Result(site['hostname'], error=PRESCAN_ERROR)
+
+    scheduler = Scheduler(hosts, workers, adaptive, per_site, subnet, stop)
+    running = {}
+
+    try:
+        while True:
+            # Keep the event loop full while the deadline allows it
+            while not (run_end and time.monotonic() >= run_end):
+                site = scheduler.next()
+                if site is None:
+                    break
+                running[asyncio.ensure_future(_atimed(task, site, args, timeout))] = (site, time.monotonic())
+
+            if not running:
+                break
+
+            wait = max(run_end - time.monotonic(), 0) if run_end else None
+            done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+            for job in done:
+                site, started = running.pop(job)
+                value, error, elapsed, congested = job.result()
+                scheduler.finished(site, started, elapsed, congested)
+                yield Result(site['hostname'], value, error, elapsed)
+
+            # Cancel hosts still running at the global deadline
+            if run_end and time.monotonic() >= run_end:
+                for job, (site, started) in list(running.items()):
+                    running.pop(job)
+                    job.cancel()
+                    scheduler.finished(site, started, time.monotonic() - started)
+                    yield Result(site['hostname'], error='Timed out - deadline reached')
+
+        # Report every host that was never started
+        status = scheduler.stopped() or 'Skipped - deadline reached'
+        for site in scheduler.remaining():
+            yield Result(site['hostname'], error=status)
+    finally:
+        for job in running:
+            job.cancel()
+
+
+if __name__ == '__main__':
+    pass
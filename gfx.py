@@ -2,6 +2,13 @@ import io
 import xml.etree.ElementTree as ET
 from zipfile import ZipFile, BadZipFile
 import eclypse
+import cache
+import remote_zip
+import transport
+
+
+# Points exposing the version of the Atrius specific GFX - major, minor, revision
+ATRIUS_VERSION_POINTS = [('analog-value', 5000), ('analog-value', 5001), ('analog-value', 5002)]
 
 
 def get_project(session, host):
@@ -12,58 +19,92 @@ def get_project(session, host):
     except Exception as e:
         raise e
 
+def get_project_remote(session, host, headers=None):
+    """Open the GFX file on the ECLYPSE for partial reads with HTTP Range requests"""
+    api_url = '/files/common/localDevice/project/Project.gfx?encode=bin'
+    url = f'{eclypse.api_base_url(host)}{api_url}'
+    return remote_zip.RemoteFile(session, url, headers)
+
+
 def get_project_metadata(project):
-    """Extract Main.xml project metadata from compressed project"""
+    """Extract Main.xml project metadata from compressed project, as bytes or a seekable file"""
     try: 
-        zip_file = ZipFile(io.BytesIO(project))
+        zip_file = ZipFile(io.BytesIO(project) if isinstance(project, bytes) else project)
     except BadZipFile as e:
         raise e
 
     return zip_file.open("Main.xml")
 
 
-def get_project_name_v1(session, host):
-    """Retrieve project name from project metadata"""
-    try:
-        project = get_project(session, host)
+def parse_project_props(project):
+    """Return the Project/Props fields from Main.xml in a compressed project
 
-        project_file = get_project_metadata(project)
-    except Exception as e:
-        raise e
+    Main.xml is parsed as it is decompressed and parsing stops at the end of Props,
+    so the rest of a large project is never read. Every field is returned, they are cached together.
+    """
+    props = {}
+    path = []
 
-    tree = ET.parse(io.BytesIO(project_file.read()))
+    with get_project_metadata(project) as project_file:
+        for event, element in ET.iterparse(project_file, events=('start', 'end')):
+            if event == 'start':
+                path.append(element.tag)
+                continue
 
-    root = tree.getroot()
+            # Root/Project/Props/<field>
+            if len(path) == 4 and path[1:3] == ['Project', 'Props']:
+                props[element.tag] = element.text
 
-    for project in root:
-        if project.tag == 'Project':
-            for props in project:
-                if props.tag == 'Props':
-                    for name in props:
-                        if name.tag == 'Name':
-                            return name.text
+            # End of Root/Project/Props
+            if len(path) == 3 and path[1:] == ['Project', 'Props']:
+                break
 
+            # Discard each element once it has been read
+            element.clear()
+            path.pop()
 
-def get_project_lastModified_v1(session, host):
-    """Retrieve project lastModified Date from project metadata"""
-    try:
-        project = get_project(session, host)
+    return props
 
-        project_file = get_project_metadata(project)
-    except Exception as e:
-        raise e
 
-    tree = ET.parse(io.BytesIO(project_file.read()))
+def get_project_props_v1(session, host, use_cache=True):
+    """Retrieve every project property from the GFX file
+
+    Only the zip central directory and the start of Main.xml are transferred, using Range requests.
+    If the ECLYPSE ignores Range, the GFX file is downloaded once instead.
+    Properties are cached per host along with the ETag, size and date of the GFX file.
+    The file is only read again when the ECLYPSE reports it has changed.
+    """
+    cached = cache.get(host, 'gfx_project', ttl=None) if use_cache else None
+
+    headers = {}
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+
+    with get_project_remote(session, host, headers) as project:
+        # Not modified since it was cached
+        if cached and project.status_code == 304:
+            return cached['props']
+
+        # Without an ETag, compare size and date before reading the project
+        key = {'etag': project.etag, 'size': project.size, 'date': project.last_modified}
+        if cached and not key['etag'] and key['size'] and all(cached.get(k) == v for k, v in key.items()):
+            return cached['props']
+
+        props = parse_project_props(project)
+
+    if use_cache:
+        cache.put(host, 'gfx_project', {**key, 'props': props})
+    return props
 
-    root = tree.getroot()
 
-    for project in root:
-        if project.tag == 'Project':
-            for props in project:
-                if props.tag == 'Props':
-                    for name in props:
-                        if name.tag == 'LastModifDate':
-                            return(name.text)
+def get_project_name_v1(session, host):
+    """Retrieve project name from project metadata"""
+    return get_project_props_v1(session, host).get('Name')
+
+
+def get_project_lastModified_v1(session, host):
+    """Retrieve project lastModified Date from project metadata"""
+    return get_project_props_v1(session, host).get('LastModifDate')
 
 def get_project_v2(session, host):
     """Get GFX name using V2 API"""
@@ -112,6 +153,47 @@ def get_project_name(session, host, version=None):
     raise Exception("API did not respond")
 
 
+def get_project_info_v1(session, host, use_cache=True):
+    """Return project name, last modified date and every project property"""
+    props = get_project_props_v1(session, host, use_cache)
+    cache.put(host, 'gfx_name', props.get('Name'))
+    return {'name': props.get('Name'), 'lastModified': props.get('LastModifDate'), 'props': props}
+
+
+def get_project_info_v2(session, host):
+    """Return project name, upload date and the program description"""
+    project = get_project_v2(session, host)
+    cache.put(host, 'gfx_name', project['project']['name'])
+    return {'name': project['project']['name'], 'lastModified': project['upload-date'], 'props': project['project']}
+
+
+def get_project_info(session, host, version=None, use_cache=True):
+    """Return project name, last modified date and properties with a single request"""
+    # If provided, only try the specified API version
+    if version == 1:
+        return get_project_info_v1(session, host, use_cache)
+    if version == 2:
+        return get_project_info_v2(session, host)
+
+    # We will attempt v1 and v2
+    # Lack of response is not an exception because we expect 1 call to fail
+
+    # Attempt v1 method
+    try:
+        return get_project_info_v1(session, host, use_cache)
+    except Exception as e:
+        pass
+
+    # Attempt v2 method
+    try:
+        return get_project_info_v2(session, host)
+    except Exception as e:
+        pass
+
+    # If we didn't get an answer, raise a exception
+    raise Exception("API did not respond")
+
+
 def get_project_lastModified(session, host, version=None):
     """Return project name"""
     # Attempts v1 and v2 API call for project name
@@ -143,24 +225,25 @@ def get_project_lastModified(session, host, version=None):
 
 def get_version_atrius(session, host):
     """Retrieve version number exposed as points in the Atrius specific GFX"""
-    major_url = "https://" + host + "/api/rest/v1/protocols/bacnet/local/objects/analog-value/5000/properties/present-value"
-    major = session.get(major_url)
-
-    minor_url = "https://" + host + "/api/rest/v1/protocols/bacnet/local/objects/analog-value/5001/properties/present-value"
-    minor = session.get(minor_url)
+    # Major, minor and revision are read at the same time
+    points = eclypse.read_local_properties(session, host, ATRIUS_VERSION_POINTS)
 
-    revision_url = "https://" + host + "/api/rest/v1/protocols/bacnet/local/objects/analog-value/5002/properties/present-value"
-    revision = session.get(revision_url)
+    for point in points:
+        if point.error:
+            raise Exception(point.error)
 
-    return major.json()['value'], minor.json()['value'], revision.json()['value']
+    major, minor, revision = (point.value for point in points)
+    return major, minor, revision
 
 
 def upload_gfx(session, host, gfx_file):
     """Upload GFX, note: requires a pre-compiled GFX in zip format"""
     update_url = "https://" + host + "/api/rest/v1/files/bacnet/inputConfiguration"
-    gfx_file_handle= {'file': open(gfx_file, 'rb')}
+    with open(gfx_file, 'rb') as infile:
+        transport.request(session, 'POST', update_url, files={'file': infile}, timeout=transport.UPLOAD_TIMEOUT)
 
-    session.post(update_url, files=gfx_file_handle)
+    # The cached project name is no longer current
+    cache.invalidate(host, ['gfx_name'])
     return True
 
 
@@ -1,11 +1,19 @@
 import csv
 import pathlib
+import inventory
+
+
+# Host lists ending in .db or .sqlite are kept in an indexed inventory database, see inventory.py
 
 
 def iter(host_list='./host_list.csv'):
     """Parse host list and yield hosts"""
+    if inventory.is_database(host_list):
+        yield from inventory.iter(host_list)
+        return
+
     with open(host_list) as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=['hostname', 'username', 'password'])
+        reader = csv.DictReader(csvfile, fieldnames=['hostname', 'username', 'password', 'site'])
 
         for line in reader:
             yield line
@@ -13,21 +21,34 @@ def iter(host_list='./host_list.csv'):
 
 def read(host_list='./host_list.csv'):
     """Return a list from hosts file"""
+    if inventory.is_database(host_list):
+        return inventory.read(host_list)
+
     # Return an empty list if the file does not exist yet. 
     if not pathlib.Path(host_list).is_file():
         return []
 
     # Return the contents of the file as a list
     with open(host_list) as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=['hostname', 'username', 'password'])
+        reader = csv.DictReader(csvfile, fieldnames=['hostname', 'username', 'password', 'site'])
 
         return [host for host in reader]
 
 
 def write(hosts, host_list='./host_list.csv'):
     """Write hosts dictionary to the specified file"""
-    with open(host_list, 'w') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=['hostname', 'username', 'password'])
+    if inventory.is_database(host_list):
+        return inventory.write(hosts, host_list)
+
+    hosts = list(hosts)
+    fieldnames = ['hostname', 'username', 'password']
+    # The site column is only written when a host has one, so other lists keep three columns
+    if any(host.get('site') for host in hosts):
+        fieldnames.append('site')
+
+    with open(host_list, 'w', newline='') as csvfile:
+        # Inventory columns such as model are not kept in a csv file
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
 
         writer.writerows(hosts)
 
@@ -39,15 +60,28 @@ def display(hosts):
 
 
 def add(hostname, username, password, host_list='./host_list.csv'):
-    """Add a new host to the end of the dictionary and write the dict to the specified file"""
+    """Add a new host to the end of the dictionary and write the dict to the specified file
+
+    A host already in the list has its credentials updated instead, as in the inventory.
+    """
+    # The inventory adds a single row instead of rewriting the list
+    if inventory.is_database(host_list):
+        return inventory.add(hostname, username, password, host_list)
+
     # If the file already exists, read the current values into a dict
     if pathlib.Path(host_list).is_file():
         hosts = read(host_list)
     else:
         hosts = []
 
-    # Add the new host to the dict
-    hosts.append({'hostname': hostname, 'username': username, 'password': password})
+    # Update the host if it is already listed, keeping its site
+    for host in hosts:
+        if host['hostname'] == hostname:
+            host.update(username=username, password=password)
+            break
+    else:
+        # Add the new host to the dict
+        hosts.append({'hostname': hostname, 'username': username, 'password': password})
 
     # Write the dict to the specified file
     write(hosts, host_list=host_list)
@@ -55,16 +89,18 @@ def add(hostname, username, password, host_list='./host_list.csv'):
 
 def delete(hostname, host_list='./host_list.csv'):
     """Delete all items by hostname from the dictionary and write the dict to the specified file"""
+    # The inventory deletes a single row instead of rewriting the list
+    if inventory.is_database(host_list):
+        return inventory.delete(hostname, host_list)
+
     # If the file already exists, read the current values into a dict
     if pathlib.Path(host_list).is_file():
         hosts = read(host_list)
     else:
         hosts = []
 
-    # Find all instances by specified host name and remove from the dictionary
-    for host in hosts:
-        if hostname in host.values():
-            hosts.remove(host)
+    # Keep every host except those with the specified host name
+    hosts = [host for host in hosts if host['hostname'] != hostname]
 
     # Write the modified list to the specified file
     write(hosts, host_list=host_list)
@@ -0,0 +1,165 @@
+import contextlib
+import sqlite3
+
+
+# ECLYPSE inventory kept in an SQLite database
+# Used in place of a host list csv file when the host list ends in .db or .sqlite.
+# Hosts are indexed by hostname, site, model, firmware and tag, so lookups and edits only touch
+# the rows involved. Every change is a transaction, so several tools can share the inventory.
+
+DATABASE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+# Columns of a host, in the same order as a host list csv file
+FIELDNAMES = ['hostname', 'username', 'password', 'site', 'model', 'firmware']
+# Seconds to wait for another tool to finish writing
+BUSY_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    hostname TEXT PRIMARY KEY,
+    username TEXT,
+    password TEXT,
+    site TEXT,
+    model TEXT,
+    firmware TEXT
+);
+CREATE INDEX IF NOT EXISTS hosts_site ON hosts (site);
+CREATE INDEX IF NOT EXISTS hosts_model ON hosts (model);
+CREATE INDEX IF NOT EXISTS hosts_firmware ON hosts (firmware);
+CREATE TABLE IF NOT EXISTS tags (
+    hostname TEXT NOT NULL REFERENCES hosts (hostname) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (hostname, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+"""
+
+_SELECT = """
+SELECT hosts.*, group_concat(tags.tag) AS tags
+FROM hosts LEFT JOIN tags ON tags.hostname = hosts.hostname
+"""
+
+
+def is_database(host_list):
+    """True if a host list path is an inventory database rather than a csv file"""
+    return str(host_list).lower().endswith(DATABASE_EXTENSIONS)
+
+
+@contextlib.contextmanager
+def connect(host_list):
+    """Open the inventory, creating it if needed, and commit or roll back on exit"""
+    db = sqlite3.connect(host_list, timeout=BUSY_TIMEOUT)
+    try:
+        db.row_factory = sqlite3.Row
+        # Readers are not blocked while another tool writes
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA foreign_keys=ON')
+        db.executescript(SCHEMA)
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _host(row):
+    host = dict(row)
+    host['tags'] = sorted(host['tags'].split(',')) if host['tags'] else []
+    return host
+
+
+def iter(host_list):
+    """Yield every host in the inventory"""
+    # Read everything at once so the database is not held open for the length of a run
+    with connect(host_list) as db:
+        rows = db.execute(_SELECT + 'GROUP BY hosts.hostname ORDER BY hosts.rowid').fetchall()
+
+    for row in rows:
+        yield _host(row)
+
+
+def read(host_list):
+    """Return a list of every host in the inventory"""
+    return list(iter(host_list))
+
+
+def get(hostname, host_list):
+    """Return a single host, or None if it is not in the inventory"""
+    with connect(host_list) as db:
+        row = db.execute(_SELECT + 'WHERE hosts.hostname = ? GROUP BY hosts.hostname', (hostname,)).fetchone()
+    return _host(row) if row else None
+
+
+def find(host_list, site=None, model=None, firmware=None, tag=None):
+    """Return the hosts matching every criteria given, using the indexes"""
+    conditions = []
+    values = []
+    for column, value in (('hosts.site', site), ('hosts.model', model), ('hosts.firmware', firmware)):
+        if value is not None:
+            conditions.append(f'{column} = ?')
+            values.append(value)
+    if tag is not None:
+        conditions.append('hosts.hostname IN (SELECT hostname FROM tags WHERE tag = ?)')
+        values.append(tag)
+
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+    with connect(host_list) as db:
+        rows = db.execute(_SELECT + where + 'GROUP BY hosts.hostname ORDER BY hosts.rowid', values).fetchall()
+    return [_host(row) for row in rows]
+
+
+def _upsert(db, host):
+    db.execute('INSERT INTO hosts (hostname, username, password, site, model, firmware) VALUES (?, ?, ?, ?, ?, ?) '
+               'ON CONFLICT (hostname) DO UPDATE SET username = excluded.username, password = excluded.password, '
+               'site = coalesce(excluded.site, site), model = coalesce(excluded.model, model), '
+               'firmware = coalesce(excluded.firmware, firmware)',
+               [host.get(name) or None for name in FIELDNAMES])
+
+    tags = host.get('tags')
+    if tags is not None:
+        db.execute('DELETE FROM tags WHERE hostname = ?', (host['hostname'],))
+        db.executemany('INSERT INTO tags (hostname, tag) VALUES (?, ?)', [(host['hostname'], tag) for tag in set(tags)])
+
+
+def write(hosts, host_list):
+    """Replace the contents of the inventory with hosts"""
+    with connect(host_list) as db:
+        db.execute('DELETE FROM hosts')
+        for host in hosts:
+            _upsert(db, host)
+
+
+def add(hostname, username, password, host_list, site=None, tags=None):
+    """Add a host, or update the credentials of a host already in the inventory"""
+    with connect(host_list) as db:
+        _upsert(db, {'hostname': hostname, 'username': username, 'password': password, 'site': site, 'tags': tags})
+
+
+def delete(hostname, host_list):
+    """Delete a host by hostname"""
+    with connect(host_list) as db:
+        db.execute('DELETE FROM hosts WHERE hostname = ?', (hostname,))
+
+
+def update(hostname, host_list, **columns):
+    """Set columns such as model and firmware of a host already in the inventory"""
+    columns = {name: value for name, value in columns.items() if name in FIELDNAMES and name != 'hostname'}
+    if not columns:
+        return
+    with connect(host_list) as db:
+        db.execute(f"UPDATE hosts SET {', '.join(f'{name} = ?' for name in columns)} WHERE hostname = ?",
+                   [*columns.values(), hostname])
+
+
+def tag(hostname, host_list, *tags):
+    """Add tags to a host"""
+    with connect(host_list) as db:
+        db.executemany('INSERT OR IGNORE INTO tags (hostname, tag) VALUES (?, ?)', [(hostname, name) for name in tags])
+
+
+def untag(hostname, host_list, *tags):
+    """Remove tags from a host"""
+    with connect(host_list) as db:
+        db.executemany('DELETE FROM tags WHERE hostname = ? AND tag = ?', [(hostname, name) for name in tags])
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,97 @@
+import json
+import os
+import sys
+import threading
+import time
+
+
+# Run journal, records the outcome of every ECLYPSE as a run progresses
+# An interrupted run is continued with --resume <run id>, which only works on the ECLYPSE
+# that did not finish or failed. Each run is a JSON Lines file in the runs directory.
+
+RUNS_DIRECTORY = './runs'
+
+
+class Journal:
+    """Record of the ECLYPSE finished by a run, appended to as each one finishes"""
+
+    def __init__(self, run_id=None, directory=RUNS_DIRECTORY, host_file=None):
+        appname = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        # The process id keeps runs of the same script started in the same second apart
+        self.run_id = run_id or f"{time.strftime('%Y%m%d-%H%M%S')}_{appname}_{os.getpid()}"
+        self.path = os.path.join(directory, f'{self.run_id}.jsonl')
+        self.lock = threading.Lock()
+        self.announced = False
+
+        # Latest status of each ECLYPSE from earlier attempts at this run
+        self.completed = set()
+        # ECLYPSE chosen with --where or --sample when the run started, None if every host was used
+        self.selected = None
+        if run_id:
+            if not os.path.isfile(self.path):
+                raise Exception(f'No run {run_id} in {directory}')
+            with open(self.path) as infile:
+                for line in infile:
+                    entry = json.loads(line)
+                    if 'selected' in entry:
+                        self.selected = set(entry['selected'])
+                    if 'host' not in entry:
+                        continue
+                    if entry['ok']:
+                        self.completed.add(entry['host'])
+                    else:
+                        self.completed.discard(entry['host'])
+
+        os.makedirs(directory, exist_ok=True)
+        # A new run never appends to another run's journal
+        self.outfile = open(self.path, 'a' if run_id else 'x')
+        # Command line arguments are not recorded, they can hold passwords
+        self._write({'run': self.run_id, 'time': time.time(), 'script': appname, 'host_file': host_file})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, entry):
+        with self.lock:
+            # Reopened when a closed journal is used again, such as by the next wave of a rollout
+            if self.outfile is None:
+                self.outfile = open(self.path, 'a')
+            self.outfile.write(json.dumps(entry) + '\n')
+            self.outfile.flush()
+
+    def select(self, hosts):
+        """Record the hosts chosen for this run, so a resumed run works on the same hosts"""
+        hosts = list(hosts)
+        self.selected = {site['hostname'] for site in hosts}
+        self._write({'selected': sorted(self.selected)})
+        return hosts
+
+    def pending(self, hosts):
+        """Yield the hosts that have not completed in an earlier attempt at this run"""
+        if not self.announced:
+            self.announced = True
+            print({'run': self.run_id, 'completed': len(self.completed)})
+
+        for site in hosts:
+            if site['hostname'] not in self.completed:
+                yield site
+
+    def record(self, result):
+        """Record the outcome of a fleet.Result"""
+        self._write({'host': result.host, 'ok': result.ok, 'status': result.error, 'time': time.time()})
+        if result.ok:
+            self.completed.add(result.host)
+
+    def close(self):
+        """Close the journal file, it is reopened if another result is recorded"""
+        with self.lock:
+            if self.outfile is not None:
+                self.outfile.close()
+                self.outfile = None
+
+
+if __name__ == '__main__':
+    pass
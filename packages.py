@@ -1,4 +1,6 @@
 import eclypse
+import cache
+import upload
 from requests import exceptions
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
@@ -17,14 +19,13 @@ def list_packages(session, host):
     return eclypse.api_get(session, host, path, version=2)
 
 
-def upload_package(session, host, package):
-    """Upload a file containing a package"""
+def upload_package(session, host, package, progress=None):
+    """Upload a file containing a package, package is a path or an upload.SharedFile shared by every host"""
     method = "/services/packages/store"
 
-    with open(package, 'rb') as open_file:
-        data = open_file.read()
-
-    return eclypse.api_post_store(session, host, method, data, version=2)
+    # The package is streamed from memory shared with other uploads rather than read per host
+    with upload.shared(package) as open_file:
+        return eclypse.api_post_store(session, host, method, open_file.reader(progress), version=2)
 
 
 def commit_all(session, host):
@@ -39,7 +40,11 @@ def commit_all(session, host):
             ]
             }
     
-    return eclypse.api_post(session, host, path, data, version=2)
+    result = eclypse.api_post(session, host, path, data, version=2)
+
+    # Installed versions change after the commit, a package can replace the GFX project
+    cache.invalidate(host, ['gfx_name'])
+    return result
 
 
 def commit_package(session, host, package):
@@ -54,5 +59,9 @@ def commit_package(session, host, package):
             ]
             }
     
-    return eclypse.api_post(host, path, data, version=2)
+    result = eclypse.api_post(session, host, path, data, version=2)
+
+    # Installed versions change after the commit, a package can replace the GFX project
+    cache.invalidate(host, ['gfx_name'])
+    return result
 
@@ -0,0 +1,63 @@
+import asyncio
+
+
+# TCP reachability scan run before the fleet runner
+# Connecting to port 443 takes a fraction of a second, so thousands of ECLYPSE are checked at once
+# and offline ECLYPSE are reported right away instead of each holding a worker until it times out.
+
+DEFAULT_PORT = 443
+# Seconds to wait for a connection
+CONNECT_TIMEOUT = 3
+# Connections attempted at the same time, kept below the usual limit of 1024 open files
+CONCURRENCY = 500
+
+
+def address(hostname, port=DEFAULT_PORT):
+    """Split a host list hostname into address and port"""
+    # IPv6 addresses contain colons, a port is only given as [address]:port
+    if hostname.startswith('['):
+        host, _, rest = hostname[1:].partition(']')
+        return host, int(rest[1:]) if rest.startswith(':') else port
+    if hostname.count(':') == 1:
+        host, port = hostname.split(':')
+        return host, int(port)
+    return hostname, port
+
+
+async def reachable(hostname, timeout=CONNECT_TIMEOUT):
+    """True if a TCP connection to the ECLYPSE web server can be opened"""
+    host, port = address(hostname)
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def scan(hosts, concurrency=CONCURRENCY, timeout=CONNECT_TIMEOUT):
+    """Return (reachable, unreachable) lists of host dictionaries, in host list order"""
+    hosts = list(hosts)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def check(site):
+        async with limit:
+            return await reachable(site['hostname'], timeout)
+
+    results = await asyncio.gather(*(check(site) for site in hosts))
+    return ([site for site, ok in zip(hosts, results) if ok],
+            [site for site, ok in zip(hosts, results) if not ok])
+
+
+def split(hosts, concurrency=CONCURRENCY, timeout=CONNECT_TIMEOUT):
+    """Scan from synchronous code, returns (reachable, unreachable)"""
+    return asyncio.run(scan(hosts, concurrency, timeout))
+
+
+if __name__ == '__main__':
+    pass
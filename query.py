@@ -0,0 +1,177 @@
+import argparse
+import fnmatch
+import ipaddress
+import itertools
+import random
+import re
+import cache
+import prescan
+
+
+# Host selection for the fleet runner
+# --where expressions are matched against the host list, or inventory, and the device facts
+# cached by earlier runs, so only the matching ECLYPSE are worked on.
+#
+#   model=S1000            equal, ignoring case, or equal to one word of the value
+#   firmware<1.18          <, <=, >, >= compare version numbers part by part
+#   site~east*             glob pattern, ignoring case
+#   hostname=10.1.0.0/16   addresses in a CIDR range
+#   tags=pilot             lists such as tags match if any item matches
+#   site!=lab              not equal, also true when the value is unknown
+
+OPERATORS = ('!=', '<=', '>=', '=', '<', '>', '~')
+_EXPRESSION = re.compile(r'^\s*([\w-]+)\s*(!=|<=|>=|=|<|>|~)\s*(.*?)\s*$')
+
+# Facts kept in the device cache, by the name used in expressions
+CACHED_FACTS = {'model': 'model', 'firmware': 'firmware', 'api_version': 'api_version', 'gfx': 'gfx_name',
+                'device_hostname': 'device_hostname'}
+# Other names accepted in expressions
+ALIASES = {'version': 'firmware', 'tag': 'tags'}
+
+
+class Condition:
+    """A single field, operator and value parsed from an expression such as firmware<1.18"""
+
+    def __init__(self, expression):
+        match = _EXPRESSION.match(expression)
+        if not match:
+            raise ValueError(f"Invalid expression '{expression}', expected field, one of {' '.join(OPERATORS)}, value")
+        self.field, self.operator, self.value = match.groups()
+
+    def __repr__(self):
+        return f'{self.field}{self.operator}{self.value}'
+
+    def matches(self, fields):
+        actual = fields.get(self.field)
+        if actual is None or actual == '' or actual == []:
+            return self.operator == '!='
+
+        values = actual if isinstance(actual, (list, tuple, set)) else [actual]
+        if self.operator == '!=':
+            return not any(self._equal(str(value)) for value in values)
+        return any(self._compare(str(value)) for value in values)
+
+    def _compare(self, actual):
+        if self.operator == '=':
+            return self._equal(actual)
+        if self.operator == '~':
+            return fnmatch.fnmatchcase(actual.lower(), self.value.lower())
+
+        left, right = version_key(actual), version_key(self.value)
+        try:
+            return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[self.operator]
+        except TypeError:
+            # A version compared with text, such as 1.18 with 'unknown'
+            return False
+
+    def _equal(self, actual):
+        if '/' in self.value:
+            network = _network(self.value)
+            if network:
+                return _in_network(actual, network)
+
+        if actual.lower() == self.value.lower():
+            return True
+        # Model names hold several words, such as ECY-S1000 E2, any one of them matches
+        return self.value.lower() in re.split(r'[\s\-_]+', actual.lower())
+
+
+def _network(value):
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+
+
+def _in_network(hostname, network):
+    address, _ = prescan.address(hostname)
+    try:
+        return ipaddress.ip_address(address) in network
+    except ValueError:
+        return False
+
+
+def version_key(value):
+    """Key comparing dotted version numbers part by part, 1.9 sorts before 1.18"""
+    parts = re.split(r'[.\-]', str(value).strip())
+    if all(part.isdigit() for part in parts):
+        return tuple(int(part) for part in parts)
+    return str(value).lower()
+
+
+def parse(expressions):
+    """Parse a list of expressions into conditions, every condition must match"""
+    return [expression if isinstance(expression, Condition) else Condition(expression)
+            for expression in expressions or []]
+
+
+def condition(expression):
+    """argparse type for a --where expression, so a mistake is reported before the run starts"""
+    try:
+        return Condition(expression)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def sample_size(sample):
+    """argparse type for --sample, a number of hosts or a percentage"""
+    if not re.fullmatch(r'\d+|\d+(\.\d+)?%', sample.strip()):
+        raise argparse.ArgumentTypeError(f"Invalid sample '{sample}', expected a number of ECLYPSE or a percentage such as 5%")
+    return sample.strip()
+
+
+def fields(site):
+    """Return the host list columns of a host with its cached device facts"""
+    values = dict(site)
+    for name, fact in CACHED_FACTS.items():
+        # A cached fact that has not expired is newer than the host list
+        value = cache.get(site['hostname'], fact)
+        # Otherwise the last known value is used, however old, when the host list has none
+        if value is None and not values.get(name):
+            value = cache.get(site['hostname'], fact, ttl=None)
+        if value is not None:
+            values[name] = value
+    for alias, name in ALIASES.items():
+        values.setdefault(alias, values.get(name))
+    return values
+
+
+def matches(site, conditions):
+    """True if a host matches every condition"""
+    if not conditions:
+        return True
+    host_fields = fields(site)
+    return all(condition.matches(host_fields) for condition in conditions)
+
+
+def sample_hosts(hosts, sample):
+    """Pick a random sample of hosts, sample is a number of hosts such as '50' or a percentage such as '5%'"""
+    sample = str(sample).strip()
+    if sample.endswith('%'):
+        # Each host is kept on its own, so the host list is still read lazily
+        fraction = float(sample[:-1]) / 100
+        return (site for site in hosts if random.random() < fraction)
+
+    # Reservoir sampling keeps only the sample in memory
+    count = int(sample)
+    hosts = iter(hosts)
+    reservoir = list(itertools.islice(hosts, count))
+    for seen, site in enumerate(hosts, count + 1):
+        index = random.randrange(seen)
+        if index < count:
+            reservoir[index] = site
+    return reservoir
+
+
+def select(hosts, where=None, sample=None):
+    """Return the hosts matching every --where expression, sampled if requested"""
+    conditions = parse(where)
+    if conditions:
+        hosts = (site for site in hosts if matches(site, conditions))
+    if sample:
+        hosts = sample_hosts(hosts, sample)
+    return hosts
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,131 @@
+import io
+import re
+import transport
+
+
+# Smallest range requested at once, zipfile makes many small reads
+BLOCK_SIZE = 64 * 1024
+
+
+class RemoteFile(io.RawIOBase):
+    """Seekable read-only file backed by HTTP Range requests
+
+    Opening a zip archive with zipfile.ZipFile(RemoteFile(...)) reads the central directory
+    from the end of the file and then only the members that are opened, so a few KB are
+    transferred instead of the whole archive.
+    If the server ignores Range and sends the whole file, it is read from that response instead.
+    """
+
+    def __init__(self, session, url, headers=None, timeout=None):
+        self.session = session
+        self.url = url
+        self.headers = {'Accept': '*/*', **(headers or {})}
+        self.timeout = timeout
+        self.position = 0
+        # Downloaded ranges as (start, bytes)
+        self.segments = []
+        self.content = None
+
+        # The first request reads the end of the file, where a zip keeps its central directory
+        self.response = transport.request(session, 'GET', url, headers={**self.headers, 'Range': f'bytes=-{BLOCK_SIZE}'},
+                                          stream=True, timeout=timeout)
+        self.status_code = self.response.status_code
+        self.etag = self.response.headers.get('ETag')
+        self.last_modified = self.response.headers.get('Last-Modified')
+        if self.status_code == 304:
+            self.size = None
+            return
+        self.response.raise_for_status()
+
+        match = re.match(r'bytes (\d+)-(\d+)/(\d+)', self.response.headers.get('Content-Range', ''))
+        if self.status_code == 206 and match:
+            self.size = int(match.group(3))
+            self.segments.append((int(match.group(1)), self.response.content))
+        else:
+            # Range is not supported, the whole file is read on first use
+            length = self.response.headers.get('Content-Length')
+            self.size = int(length) if length else None
+
+    @property
+    def ranged(self):
+        """True if the server honoured the Range request"""
+        return self.status_code == 206
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self._size() + offset
+        return self.position
+
+    def _size(self):
+        if self.size is None:
+            self._whole()
+        return self.size
+
+    def _whole(self):
+        """Read the whole file from the first response when Range is not supported"""
+        if self.content is None:
+            self.content = self.response.content
+            self.size = len(self.content)
+        return self.content
+
+    def _fetch(self, start, end):
+        """Download bytes start to end (exclusive) with a Range request"""
+        headers = {**self.headers, 'Range': f'bytes={start}-{end - 1}'}
+        headers.pop('If-None-Match', None)
+        with transport.request(self.session, 'GET', self.url, headers=headers, timeout=self.timeout) as result:
+            result.raise_for_status()
+            if result.status_code != 206:
+                raise Exception('Server stopped honouring Range requests')
+            self.segments.append((start, result.content))
+
+    def _cached(self, start, size):
+        for segment_start, data in self.segments:
+            if segment_start <= start and start + size <= segment_start + len(data):
+                return data[start - segment_start:start - segment_start + size]
+        return None
+
+    def read(self, size=-1):
+        if not self.ranged:
+            data = self._whole()[self.position:] if size is None or size < 0 else \
+                self._whole()[self.position:self.position + size]
+            self.position += len(data)
+            return data
+
+        if size is None or size < 0:
+            size = self.size - self.position
+        size = max(min(size, self.size - self.position), 0)
+
+        data = self._cached(self.position, size)
+        if data is None:
+            # Read ahead so the next small reads are served from memory
+            self._fetch(self.position, min(self.position + max(size, BLOCK_SIZE), self.size))
+            data = self._cached(self.position, size)
+
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.response.close()
+        super().close()
+
+
+if __name__ == '__main__':
+    pass
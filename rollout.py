@@ -0,0 +1,124 @@
+import math
+import threading
+import time
+import fleet
+
+
+# Staged rollout of a task, such as a firmware upgrade, across the fleet
+# A small canary wave goes first, then each wave is larger than the last.
+# The rollout stops starting new ECLYPSE when too many of them fail, so a bad firmware
+# or a bad network only reaches the ECLYPSE already in progress.
+
+# Each wave is this many times larger than the one before
+DEFAULT_GROWTH = 2
+# Error rate is not judged on fewer results than this, except in the canary wave
+MIN_RESULTS = 5
+
+
+class TokenBucket:
+    """Limit the combined rate of all uploads, shared by every worker
+
+    consume() blocks until the bytes about to be sent fit within the budget.
+    """
+
+    def __init__(self, rate, burst=None):
+        # Bytes per second
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Take the bytes now and sleep off any debt, so waiting workers are served in turn
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
+
+
+def bandwidth_limit(megabits):
+    """Return a TokenBucket for a budget in megabits per second, or None for no limit"""
+    if not megabits:
+        return None
+    return TokenBucket(megabits * 1000 * 1000 / 8)
+
+
+def waves(hosts, canary=None, growth=DEFAULT_GROWTH):
+    """Split hosts into waves, a canary wave of `canary` percent then waves growing by `growth`"""
+    if not canary:
+        return [hosts] if hosts else []
+
+    result = []
+    size = max(1, math.ceil(len(hosts) * canary / 100))
+    position = 0
+    while position < len(hosts):
+        result.append(hosts[position:position + size])
+        position += size
+        size = max(size + 1, int(size * growth))
+    return result
+
+
+def run(hosts, task, *args, canary=None, growth=DEFAULT_GROWTH, max_errors=None, pause=0,
+        where=None, sample=None, **options):
+    """Run task(site, *args) on hosts in waves and yield a Result for every host
+
+    `options` are passed to fleet.run for each wave.
+    Hosts are chosen with `where` and `sample` before they are split into waves.
+    If more than `max_errors` percent of the finished hosts have failed, no more hosts are
+    started, the hosts in progress are allowed to finish and every other host is reported
+    as skipped. `pause` seconds are waited between waves, for example to let the canary
+    ECLYPSE reboot before judging them.
+    A `deadline` covers the whole rollout, each wave is given the seconds that are left and
+    the hosts of waves that cannot start before it are reported as skipped.
+    """
+    hosts = list(fleet.select(hosts, where, sample, options.get('journal')))
+    plan = waves(hosts, canary, growth)
+    finished = 0
+    failed = 0
+    halted = False
+    deadline = options.pop('deadline', None)
+    run_end = time.monotonic() + deadline if deadline else None
+
+    for number, wave in enumerate(plan, 1):
+        if halted:
+            for site in wave:
+                yield fleet.Result(site['hostname'], error='Skipped - rollout halted')
+            continue
+
+        # The deadline is not restarted for each wave
+        remaining = max(0, run_end - time.monotonic()) if run_end else None
+        if remaining == 0:
+            for site in wave:
+                yield fleet.Result(site['hostname'], error='Skipped - deadline reached')
+            continue
+
+        if len(plan) > 1:
+            print({'wave': number, 'of': len(plan), 'hosts': len(wave)})
+
+        def stop():
+            # Reaches hosts the fleet runner has read ahead as well as the rest of the wave
+            return 'Skipped - rollout halted' if halted else None
+
+        for result in fleet.run(wave, task, *args, stop=stop, deadline=remaining, **options):
+            finished += 1
+            if not result.ok:
+                failed += 1
+
+            if max_errors is not None and finished >= min(MIN_RESULTS, len(plan[0])):
+                if failed * 100 / finished > max_errors and not halted:
+                    halted = True
+                    print({'status': f'Rollout halted - {failed} of {finished} ECLYPSE failed'})
+            yield result
+
+        if pause and not halted and number < len(plan):
+            time.sleep(min(pause, max(0, run_end - time.monotonic())) if run_end else pause)
+
+
+if __name__ == '__main__':
+    pass
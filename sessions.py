@@ -0,0 +1,114 @@
+import atexit
+import collections
+import contextlib
+import ssl
+import threading
+import requests
+import requests.adapters
+
+
+# Shared HTTPS sessions, one per ECLYPSE and set of credentials
+# The TLS handshake is the slowest part of a request to an ECLYPSE, so connections are kept
+# open and reused by every request and every task run against the same ECLYPSE in this process.
+
+# Connections kept open to a single ECLYPSE, enough for concurrent point reads
+POOL_MAXSIZE = 10
+# Sessions kept open at once, the least recently used session is closed past this
+# Each open session holds sockets, large fleets would otherwise run out of file descriptors
+MAX_SESSIONS = 256
+
+_lock = threading.Lock()
+_sessions = collections.OrderedDict()
+_ssl_context = None
+
+
+def ssl_context():
+    """SSL context shared by every session
+
+    Certificate verification is disabled for the default self-signed ECLYPSE certificate.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        _ssl_context = context
+    return _ssl_context
+
+
+class EclypseAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter with a connection pool sized for a single ECLYPSE and the shared SSL context"""
+
+    def __init__(self, **kwargs):
+        super().__init__(pool_connections=1, pool_maxsize=POOL_MAXSIZE, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = ssl_context()
+        return super().init_poolmanager(*args, **kwargs)
+
+
+def new_session(username, password):
+    """Create a session configured for the ECLYPSE local API"""
+    session = requests.session()
+    # ECLYPSE local API requires HTTP basic authentiation
+    session.auth = (username, password)
+    # Disable SSL certificate verification when using default self-signed certificate
+    session.verify = False
+    # Keep connections open between requests
+    session.headers['Connection'] = 'keep-alive'
+    session.mount('https://', EclypseAdapter())
+    return session
+
+
+def get(hostname, username, password):
+    """Return the open session for an ECLYPSE, creating it on first use"""
+    key = (hostname, username, password)
+    with _lock:
+        session = _sessions.get(key)
+        if session is not None:
+            _sessions.move_to_end(key)
+            return session
+
+        session = _sessions[key] = new_session(username, password)
+        while len(_sessions) > MAX_SESSIONS:
+            _, oldest = _sessions.popitem(last=False)
+            oldest.close()
+        return session
+
+
+@contextlib.contextmanager
+def session(hostname, username, password):
+    """Use the shared session for an ECLYPSE, it stays open for the next task
+
+    The session is dropped if the block fails, so a broken connection is not reused.
+    """
+    shared = get(hostname, username, password)
+    try:
+        yield shared
+    except requests.exceptions.ConnectionError:
+        discard(hostname, username, password)
+        raise
+
+
+def discard(hostname, username, password):
+    """Close and forget the session for an ECLYPSE"""
+    with _lock:
+        shared = _sessions.pop((hostname, username, password), None)
+    if shared is not None:
+        shared.close()
+
+
+def close_all():
+    """Close every open session"""
+    with _lock:
+        open_sessions = list(_sessions.values())
+        _sessions.clear()
+    for shared in open_sessions:
+        shared.close()
+
+
+atexit.register(close_all)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+import util
+
+
+# Output files that are written one row at a time
+# Every sink has a fixed list of columns so rows with missing or extra keys can be mixed,
+# such as error rows that only have a host and a status.
+# Each row is written as soon as it arrives, so memory use stays flat and a crash keeps every
+# row written so far. The file can be followed while a run is in progress.
+
+
+class CsvSink:
+    """Append rows to a CSV file, flushing each row so the file can be followed while it is written"""
+
+    def __init__(self, path, fieldnames):
+        self.fieldnames = list(fieldnames)
+        new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+
+        self.outfile = open(path, 'a', newline='')
+        self.writer = csv.DictWriter(self.outfile, fieldnames=self.fieldnames, restval='', extrasaction='ignore')
+        if new_file:
+            self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonLinesSink:
+    """Append rows to a JSON Lines file, one JSON object per line with the same keys in every row"""
+
+    def __init__(self, path, fieldnames):
+        self.fieldnames = list(fieldnames)
+        self.outfile = open(path, 'a')
+
+    def write(self, row):
+        self.outfile.write(json.dumps({name: row.get(name) for name in self.fieldnames}, default=str) + '\n')
+        self.outfile.flush()
+
+    def close(self):
+        self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullSink:
+    """Discard rows, used when a script is not asked to write an output file"""
+
+    def write(self, row):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetSink:
+    """Write rows to a columnar Parquet file in row groups, requires pyarrow
+
+    types maps a column to 'float64', 'int64' or 'bool', other columns are stored as strings.
+    Values that cannot be converted to the column type are stored as null.
+    Rows are buffered until a row group is full, the file can only be read once it is closed.
+    """
+
+    def __init__(self, path, fieldnames, types=None, row_group_size=1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception('Parquet output requires pyarrow, install it with: pip install pyarrow')
+
+        self.pyarrow = pyarrow
+        self.fieldnames = list(fieldnames)
+        self.types = {name: (types or {}).get(name, 'string') for name in self.fieldnames}
+        # pyarrow names the boolean type bool_
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, {'bool': 'bool_'}.get(self.types[name], self.types[name]))())
+                                      for name in self.fieldnames])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def _convert(self, value, column_type):
+        if value is None or value == '':
+            return None
+        try:
+            if column_type == 'float64':
+                return float(value)
+            if column_type == 'int64':
+                return int(value)
+            if column_type == 'bool':
+                return value if isinstance(value, bool) else str(value).lower() in ('true', '1', 'active', 'on')
+        except (TypeError, ValueError):
+            return None
+        return str(value)
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows as a row group"""
+        if not self.rows:
+            return
+
+        columns = {name: [self._convert(row.get(name), self.types[name]) for row in self.rows]
+                   for name in self.fieldnames}
+        self.writer.write_table(self.pyarrow.table(columns, schema=self.schema))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_sink(path, fieldnames, types=None):
+    """Open a sink for the output file, the format is chosen by the file extension
+
+    .parquet is written as Parquet, .jsonl or .ndjson as JSON Lines and anything else as CSV.
+    No file is written if path is None.
+    """
+    if not path:
+        return NullSink()
+    if path.endswith('.parquet'):
+        return ParquetSink(path, fieldnames, types)
+    if path.endswith(('.jsonl', '.ndjson')):
+        return JsonLinesSink(path, fieldnames)
+    return CsvSink(path, fieldnames)
+
+
+def add_arguments(parser, report=False):
+    """Add the --output option to a script's argument parser
+
+    Scripts that always wrote a report default to a dated csv file, other scripts write no file by default.
+    """
+    default = util.output_filename() if report else None
+    parser.add_argument('-o', '--output', default=default,
+                        help='Write each result as it arrives to this .csv, .jsonl or .parquet file'
+                             + (f' (default {default})' if default else ''))
+
+
+if __name__ == '__main__':
+    pass
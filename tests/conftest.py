@@ -0,0 +1,16 @@
+import os
+import sys
+
+# The SDK modules live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import cache
+
+
+@pytest.fixture
+def device_cache(tmp_path, monkeypatch):
+    """An empty device cache in a temporary file"""
+    monkeypatch.setattr(cache, 'CACHE_FILE', str(tmp_path / 'eclypse_cache.json'))
+    monkeypatch.setattr(cache, '_store', None)
+    return cache
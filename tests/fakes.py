@@ -0,0 +1,51 @@
+import requests
+
+
+# Stand-ins for ECLYPSE connections used by the tests
+
+class FakeResponse:
+    """Response returned by FakeSession"""
+
+    def __init__(self, status_code=200, body=None, content=b'', headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.content = content
+        self.headers = headers or {}
+        self.ok = status_code < 400
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f'{self.status_code} Error')
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeSession:
+    """Stands in for a requests session, answers each request with the next queued response
+
+    A queued exception is raised instead of returning a response.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        response = self.responses.pop(0) if self.responses else FakeResponse()
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        self.closed = True
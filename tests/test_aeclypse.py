@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import threading
+import httpx
+import aeclypse
+import cache
+
+
+def test_device_cache_is_used_off_the_event_loop(device_cache, monkeypatch):
+    threads = []
+    original_get, original_put = cache.get, cache.put
+
+    def get(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return original_get(*args, **kwargs)
+
+    def put(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return original_put(*args, **kwargs)
+
+    async def detect_api_version(session, host):
+        return 2
+
+    monkeypatch.setattr(cache, 'get', get)
+    monkeypatch.setattr(cache, 'put', put)
+    monkeypatch.setattr(aeclypse, 'detect_api_version', detect_api_version)
+
+    assert asyncio.run(aeclypse.api_version(None, 'ecy1')) == 2
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+    assert original_get('ecy1', 'api_version') == 2
+
+
+def _client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_wait_for_version_returns_after_a_reboot(device_cache, monkeypatch):
+    replies = [httpx.ConnectError('refused'), 503, '1.18']
+
+    def handler(request):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        if isinstance(reply, int):
+            return httpx.Response(reply)
+        return httpx.Response(200, json={'modelName': 'ECY-S1000', 'softwareVersion': reply})
+
+    async def no_sleep(seconds):
+        pass
+
+    monkeypatch.setattr(aeclypse.asyncio, 'sleep', no_sleep)
+
+    async def wait():
+        async with _client(handler) as session:
+            return await aeclypse.wait_for_version(session, 'ecy1', '1.19')
+
+    # Came back on the old firmware after refusing connections
+    assert asyncio.run(wait()) == '1.18'
+    assert cache.get('ecy1', 'model') == 'ECY-S1000'
+
+
+def test_read_local_properties_records_errors_per_point():
+    def handler(request):
+        if '/analog-value/2/' in request.url.path:
+            return httpx.Response(404)
+        return httpx.Response(200, json={'value': 21.5})
+
+    async def read():
+        async with _client(handler) as session:
+            return await aeclypse.read_local_properties(session, 'ecy1', [('analog-value', 1), ('analog-value', '2')])
+
+    first, second = asyncio.run(read())
+    assert first.value == 21.5 and first.error is None
+    assert second.instance == 2 and second.value is None and second.error
+
+
+def test_download_store_resumes_a_partial_file(tmp_path):
+    content = b'0123456789' * 1000
+    destination = tmp_path / 'backup.zip'
+    (tmp_path / 'backup.zip.part').write_bytes(content[:4000])
+
+    def handler(request):
+        assert request.headers['Range'] == 'bytes=4000-'
+        return httpx.Response(206, content=content[4000:])
+
+    async def download():
+        async with _client(handler) as session:
+            return await aeclypse.api_download_store(session, 'ecy1', '/store/backup.zip', str(destination))
+
+    assert asyncio.run(download()) == hashlib.sha256(content).hexdigest()
+    assert destination.read_bytes() == content
+    assert not (tmp_path / 'backup.zip.part').exists()
+
+
+def test_firmware_upload_streams_the_file_and_invalidates_the_firmware(device_cache, tmp_path):
+    firmware = tmp_path / 'firmware.zip'
+    firmware.write_bytes(b'x' * 200000)
+    cache.put('ecy1', 'model', 'ECY-S1000')
+    cache.put('ecy1', 'firmware', '1.18')
+    received = {}
+
+    class Limiter:
+        consumed = 0
+
+        def consume(self, amount):
+            Limiter.consumed += amount
+
+    def handler(request):
+        received['body'] = request.read()
+        received['length'] = int(request.headers['Content-Length'])
+        return httpx.Response(200)
+
+    async def update():
+        async with _client(handler) as session:
+            return await aeclypse.update_eclypse_firmware(session, 'ecy1', str(firmware), limiter=Limiter())
+
+    assert asyncio.run(update()).status_code == 200
+    assert len(received['body']) == received['length']
+    assert b'x' * 200000 in received['body']
+    assert Limiter.consumed == received['length']
+    assert cache.get('ecy1', 'firmware') is None
+    assert cache.get('ecy1', 'model') == 'ECY-S1000'
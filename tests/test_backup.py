@@ -0,0 +1,47 @@
+import pytest
+import backup
+
+
+@pytest.fixture
+def listings(monkeypatch):
+    """Replace the backup list with a sequence of listings, one per poll"""
+    polls = []
+
+    def sizes(session, host, api_version=None):
+        return polls.pop(0) if len(polls) > 1 else polls[0]
+
+    monkeypatch.setattr(backup, 'sizes', sizes)
+    monkeypatch.setattr(backup.time, 'sleep', lambda seconds: None)
+    return polls
+
+
+def test_waits_until_the_new_backup_stops_growing(listings):
+    listings.extend([{'old': 10}, {'old': 10, 'new': 100}, {'old': 10, 'new': 500}, {'old': 10, 'new': 500}])
+    assert backup.wait_for_new(None, 'ecy1', {'old'}, api_version=2) == 'new'
+    assert listings == [{'old': 10, 'new': 500}]
+
+
+def test_backup_without_a_listed_size_is_seen_twice(listings):
+    listings.extend([{'new': None}, {'new': None}, {'later': None}])
+    assert backup.wait_for_new(None, 'ecy1', set(), api_version=2) == 'new'
+    assert len(listings) == 1
+
+
+def test_backup_still_growing_at_the_timeout(listings):
+    listings.append({'new': 1})
+    with pytest.raises(Exception, match='still being written'):
+        backup.wait_for_new(None, 'ecy1', set(), api_version=2, timeout=0)
+
+
+def test_listed_sizes_from_either_api(monkeypatch):
+    class Response:
+        def __init__(self, body):
+            self.body = body
+
+        def json(self):
+            return self.body
+
+    monkeypatch.setattr(backup.eclypse, 'api_get', lambda session, host, path, version=1: Response(
+        [{'name': 'a', 'size': 12}, {'name': 'b'}] if version == 1 else {'c': {'size': 7}, 'd': {}}))
+    assert backup.sizes(None, 'ecy1', api_version=1) == {'a': 12, 'b': None}
+    assert backup.sizes(None, 'ecy1', api_version=2) == {'c': 7, 'd': None}
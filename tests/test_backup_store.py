@@ -0,0 +1,79 @@
+import random
+import zipfile
+import backup_store
+
+
+def _gear_boundaries(data):
+    """The rolling hash one byte at a time, as content_boundaries is defined"""
+    boundaries = [0]
+    rolling = 0
+    start = 0
+    for position, byte in enumerate(data, 1):
+        rolling = ((rolling << 1) + backup_store._GEAR[byte]) & 0xFFFFFFFF
+        length = position - start
+        if (length >= backup_store.MIN_CHUNK and not rolling & backup_store.CHUNK_MASK) or length >= backup_store.MAX_CHUNK:
+            boundaries.append(position)
+            start = position
+            rolling = 0
+    if boundaries[-1] != len(data):
+        boundaries.append(len(data))
+    return boundaries
+
+
+def test_content_boundaries_are_stable(tmp_path):
+    path = tmp_path / 'backup.bin'
+    path.write_bytes(random.Random(9).randbytes(300000))
+    assert backup_store.content_boundaries(path) == [0, 49076, 110574, 128353, 239502, 300000]
+
+
+def test_content_boundaries_match_the_rolling_hash_across_blocks(tmp_path):
+    source = random.Random(3)
+    # Random data either side of a run of zeros longer than MAX_CHUNK, which is split at MAX_CHUNK
+    data = source.randbytes(700000) + bytes(backup_store.MAX_CHUNK + 5000) + source.randbytes(600000)
+    path = tmp_path / 'backup.bin'
+    path.write_bytes(data)
+    assert backup_store.content_boundaries(path) == _gear_boundaries(data)
+
+
+def test_short_and_empty_files(tmp_path):
+    path = tmp_path / 'backup.bin'
+    path.write_bytes(b'')
+    assert backup_store.content_boundaries(path) == [0]
+    path.write_bytes(b'abc')
+    assert backup_store.content_boundaries(path) == [0, 3]
+
+
+def test_add_and_restore_a_backup(tmp_path):
+    repository = tmp_path / 'store'
+    first = tmp_path / 'first.bin'
+    second = tmp_path / 'second.bin'
+    data = random.Random(5).randbytes(500000)
+    first.write_bytes(data)
+    # The next day's backup only changed in the middle
+    second.write_bytes(data[:250000] + b'changed' + data[250000:])
+
+    summary = backup_store.add(repository, 'ecy1', 'day1', first)
+    assert summary['size'] == summary['stored'] == len(data)
+    summary = backup_store.add(repository, 'ecy1', 'day2', second)
+    assert summary['stored'] < len(data) / 2
+
+    assert backup_store.find(repository, 'ecy1') == 'day2'
+    restored = backup_store.restore(repository, 'ecy1', 'day1', tmp_path / 'restored.bin')
+    assert restored.read_bytes() == data
+
+
+def test_zip_members_are_split_from_their_headers(tmp_path):
+    path = tmp_path / 'backup.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('a.txt', b'a' * 1000)
+        archive.writestr('b.txt', b'b' * 1000)
+
+    boundaries = backup_store.zip_boundaries(path)
+    with zipfile.ZipFile(path) as archive:
+        for member in archive.infolist():
+            assert member.header_offset in boundaries
+    assert boundaries[0] == 0 and boundaries[-1] == path.stat().st_size
+
+    other = tmp_path / 'backup.bin'
+    other.write_bytes(b'not a zip')
+    assert backup_store.zip_boundaries(other) is None
@@ -0,0 +1,59 @@
+import cache
+
+
+def test_details_expire_after_their_ttl(device_cache, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    cache.put('ecy1', 'firmware', '1.18')
+    cache.put('ecy1', 'model', 'ECY-S1000')
+
+    now[0] += cache.TTLS['firmware'] + 1
+    assert cache.get('ecy1', 'firmware') is None
+    assert cache.get('ecy1', 'model') == 'ECY-S1000'
+    # A ttl of None trusts the last known value however old
+    assert cache.get('ecy1', 'firmware', ttl=None) == '1.18'
+    assert cache.get('ecy1', 'model', ttl=10) is None
+
+
+def test_invalidate_named_details(device_cache):
+    cache.put('ecy1', 'firmware', '1.18')
+    cache.put('ecy1', 'model', 'ECY-S1000')
+    cache.invalidate('ecy1', ['firmware'])
+    assert cache.get('ecy1', 'firmware') is None
+    assert cache.get('ecy1', 'firmware', ttl=None) is None
+    assert cache.get('ecy1', 'model') == 'ECY-S1000'
+
+
+def test_invalidate_everything_until_details_are_put_again(device_cache, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    cache.put('ecy1', 'model', 'ECY-S1000')
+    now[0] += 1
+    cache.invalidate('ecy1')
+    assert cache.store().get('ecy1') == {cache.INVALIDATED: {'time': now[0]}}
+    assert cache.get('ecy1', 'model') is None
+
+    now[0] += 1
+    cache.put('ecy1', 'model', 'ECY-S1000')
+    assert cache.get('ecy1', 'model') == 'ECY-S1000'
+
+
+def test_disabled_cache_misses(device_cache, monkeypatch):
+    monkeypatch.setattr(cache, 'ENABLED', False)
+    cache.put('ecy1', 'model', 'ECY-S1000')
+    assert cache.get('ecy1', 'model') is None
+
+
+def test_saves_merge_the_newer_details_of_each_process(tmp_path):
+    path = tmp_path / 'eclypse_cache.json'
+    first, second = cache.JsonStore(path), cache.JsonStore(path)
+
+    first.set('ecy1', {'model': {'value': 'ECY-S1000', 'time': 1}, 'firmware': {'value': '1.17', 'time': 1}})
+    second.set('ecy1', {'firmware': {'value': '1.18', 'time': 2}})
+    second.set('ecy2', {'model': {'value': 'ECY-303', 'time': 2}})
+    second.save()
+    first.save()
+
+    merged = cache.JsonStore(path)
+    assert merged.get('ecy1') == {'model': {'value': 'ECY-S1000', 'time': 1}, 'firmware': {'value': '1.18', 'time': 2}}
+    assert merged.get('ecy2') == {'model': {'value': 'ECY-303', 'time': 2}}
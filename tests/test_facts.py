@@ -0,0 +1,48 @@
+import eclypse
+import facts
+import packages
+from fakes import FakeResponse, FakeSession
+
+
+def gathered(cache):
+    cache.put('10.0.0.1', 'model', 'ECY-S1000 E2')
+    cache.put('10.0.0.1', 'firmware', '1.17.1.1')
+    cache.put('10.0.0.1', 'api_version', 1)
+    cache.put('10.0.0.1', 'gfx_name', 'AHU')
+    cache.put('10.0.0.1', 'device_hostname', 'ecy-1')
+
+
+def test_device_info_uses_cached_facts(device_cache):
+    gathered(device_cache)
+    session = FakeSession()
+    assert facts.device_info(session, '10.0.0.1') == {'modelName': 'ECY-S1000 E2', 'softwareVersion': '1.17.1.1'}
+    assert session.requests == []
+
+
+def test_device_info_refresh_reads_the_device(device_cache):
+    gathered(device_cache)
+    session = FakeSession(FakeResponse(body={'modelName': 'ECY-S1000 E2', 'softwareVersion': '1.18.0.1'}))
+    assert facts.device_info(session, '10.0.0.1', refresh=True)['softwareVersion'] == '1.18.0.1'
+    assert device_cache.get('10.0.0.1', 'firmware') == '1.18.0.1'
+
+
+def test_model_survives_a_firmware_update(device_cache, tmp_path):
+    gathered(device_cache)
+    firmware = tmp_path / 'firmware.zip'
+    firmware.write_bytes(b'firmware')
+
+    eclypse.update_eclypse_firmware(FakeSession(), '10.0.0.1', str(firmware))
+
+    assert device_cache.get('10.0.0.1', 'model') == 'ECY-S1000 E2'
+    assert device_cache.get('10.0.0.1', 'device_hostname') == 'ecy-1'
+    assert device_cache.get('10.0.0.1', 'gfx_name') == 'AHU'
+    assert device_cache.get('10.0.0.1', 'firmware') is None
+    assert device_cache.get('10.0.0.1', 'api_version') is None
+
+
+def test_package_commit_only_discards_the_gfx_name(device_cache):
+    gathered(device_cache)
+    packages.commit_all(FakeSession(), '10.0.0.1')
+    assert device_cache.get('10.0.0.1', 'gfx_name') is None
+    assert device_cache.get('10.0.0.1', 'model') == 'ECY-S1000 E2'
+    assert device_cache.get('10.0.0.1', 'firmware') == '1.17.1.1'
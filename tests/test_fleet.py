@@ -0,0 +1,104 @@
+import threading
+import time
+import fleet
+
+
+def hosts(count, site=None):
+    return [{'hostname': f'10.0.{index}.1', 'site': site} for index in range(count)]
+
+
+def test_scheduler_keeps_within_the_worker_and_site_limits():
+    sites = [{'hostname': f'h{index}', 'site': 'east' if index % 2 else 'west'} for index in range(6)]
+    scheduler = fleet.Scheduler(sites, workers=3, per_site=1)
+
+    started = [scheduler.next(), scheduler.next(), scheduler.next()]
+    assert [site['hostname'] for site in started[:2]] == ['h0', 'h1']
+    # Both sites are full, h2 is held rather than started
+    assert started[2] is None
+
+    scheduler.finished(started[0], time.monotonic(), 0.1)
+    assert scheduler.next()['hostname'] == 'h2'
+    assert [site['hostname'] for site in scheduler.remaining()] == ['h3', 'h4', 'h5']
+
+
+def test_scheduler_stops_starting_hosts():
+    status = []
+    scheduler = fleet.Scheduler(hosts(3), workers=3, stop=lambda: status[0] if status else None)
+    assert scheduler.next() is not None
+    status.append('Skipped - stopped')
+    assert scheduler.next() is None
+    assert scheduler.stopped() == 'Skipped - stopped'
+
+
+def test_site_key_uses_the_site_column_or_subnet():
+    assert fleet.site_key({'hostname': '10.1.2.3', 'site': 'east'}) == 'east'
+    assert fleet.site_key({'hostname': '10.1.2.3:8443'}) == '10.1.2.0/24'
+    assert fleet.site_key({'hostname': '10.1.2.3'}, subnet=16) == '10.1.0.0/16'
+    assert fleet.site_key({'hostname': 'ecy.example.com'}) == 'ecy.example.com'
+
+
+def test_timeout_abandons_only_the_slow_host():
+    release = threading.Event()
+
+    def task(site):
+        if site['hostname'] == '10.0.0.1':
+            release.wait(5)
+        return 'done'
+
+    try:
+        results = {result.host: result for result in fleet.run(hosts(5), task, workers=2, timeout=0.2)}
+    finally:
+        release.set()
+    assert results['10.0.0.1'].error == 'Timed out'
+    assert all(results[host].value == 'done' for host in results if host != '10.0.0.1')
+
+
+def test_timeout_starts_when_the_task_starts():
+    def task(site):
+        time.sleep(0.15)
+        return 'done'
+
+    # Each host waits for the one before it, but none runs for longer than the timeout
+    results = list(fleet.run(hosts(4), task, workers=1, timeout=0.3))
+    assert all(result.ok for result in results)
+
+
+def test_deadline_skips_hosts_not_started():
+    def task(site):
+        time.sleep(0.1)
+        return 'done'
+
+    start = time.monotonic()
+    results = list(fleet.run(hosts(20), task, workers=2, deadline=0.25))
+    assert time.monotonic() - start < 1
+    assert len(results) == 20
+    assert 0 < sum(result.ok for result in results) < 20
+    assert all(result.error in ('Skipped - deadline reached', 'Timed out - deadline reached')
+               for result in results if not result.ok)
+
+
+def test_stop_reports_the_remaining_hosts_with_its_status():
+    finished = []
+
+    def task(site):
+        finished.append(site['hostname'])
+        return 'done'
+
+    def stop():
+        return 'Skipped - halted' if len(finished) >= 2 else None
+
+    results = list(fleet.run(hosts(10), task, workers=1, stop=stop))
+    assert len(results) == 10
+    assert sum(result.ok for result in results) == 2
+    assert {result.error for result in results if not result.ok} == {'Skipped - halted'}
+
+
+def test_errors_are_reported_per_host():
+    def task(site):
+        if site['hostname'] == '10.0.1.1':
+            raise Exception('failed')
+        return 'done'
+
+    results = {result.host: result for result in fleet.run(hosts(3), task)}
+    assert results['10.0.1.1'].error and not results['10.0.1.1'].ok
+    assert results['10.0.2.1'].ok
@@ -0,0 +1,24 @@
+import host_list
+
+
+def test_lists_without_sites_keep_three_columns(tmp_path):
+    path = str(tmp_path / 'hosts.csv')
+    host_list.add('ecy1', 'admin', 'secret', path)
+    with open(path, newline='') as infile:
+        assert infile.read() == 'ecy1,admin,secret\r\n'
+
+
+def test_site_column_is_written_when_a_host_has_one(tmp_path):
+    path = str(tmp_path / 'hosts.csv')
+    host_list.write([{'hostname': 'ecy1', 'username': 'admin', 'password': 'secret', 'site': 'east'},
+                     {'hostname': 'ecy2', 'username': 'admin', 'password': 'secret'}], path)
+    with open(path, newline='') as infile:
+        assert infile.read() == 'ecy1,admin,secret,east\r\necy2,admin,secret,\r\n'
+
+
+def test_adding_a_listed_host_updates_it_like_the_inventory(tmp_path):
+    for path in (str(tmp_path / 'hosts.csv'), str(tmp_path / 'hosts.db')):
+        host_list.write([{'hostname': 'ecy1', 'username': 'admin', 'password': 'old', 'site': 'east'}], path)
+        host_list.add('ecy1', 'admin', 'new', path)
+        hosts = host_list.read(path)
+        assert [(host['hostname'], host['password'], host['site']) for host in hosts] == [('ecy1', 'new', 'east')]
@@ -0,0 +1,52 @@
+import json
+import pytest
+import fleet
+import journal
+
+
+def test_runs_started_in_the_same_second_do_not_share_a_journal(tmp_path, monkeypatch):
+    first = journal.Journal(directory=tmp_path)
+    monkeypatch.setattr(journal.os, 'getpid', lambda: 1)
+    second = journal.Journal(directory=tmp_path)
+    assert first.path != second.path
+    first.close()
+    second.close()
+
+
+def test_a_new_run_never_appends_to_an_existing_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal.time, 'strftime', lambda format: '20240101-000000')
+    journal.Journal(directory=tmp_path).close()
+    with pytest.raises(FileExistsError):
+        journal.Journal(directory=tmp_path)
+
+
+def test_resume_skips_completed_hosts(tmp_path):
+    hosts = [{'hostname': name} for name in ('a', 'b', 'c')]
+
+    def task(site):
+        if site['hostname'] == 'b':
+            raise Exception('failed')
+        return {'host': site['hostname']}
+
+    first = journal.Journal(directory=tmp_path, host_file='hosts.csv')
+    assert len(list(fleet.run(hosts, task, journal=first))) == 3
+    assert first.outfile is None
+
+    resumed = journal.Journal(first.run_id, directory=tmp_path)
+    assert resumed.completed == {'a', 'c'}
+    assert [result.host for result in fleet.run(hosts, lambda site: {}, journal=resumed)] == ['b']
+
+    with open(first.path) as infile:
+        header = json.loads(infile.readline())
+    assert header['host_file'] == 'hosts.csv'
+    assert 'args' not in header
+
+
+def test_resume_keeps_the_selected_hosts(tmp_path):
+    hosts = [{'hostname': f'h{index}', 'site': 'lab'} for index in range(20)]
+    first = journal.Journal(directory=tmp_path)
+    chosen = {result.host for result in fleet.run(hosts, lambda site: 1 / 0, sample='5', journal=first)}
+
+    resumed = journal.Journal(first.run_id, directory=tmp_path)
+    again = {result.host for result in fleet.run(hosts, lambda site: {}, sample='5', journal=resumed)}
+    assert again == chosen
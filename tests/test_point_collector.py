@@ -0,0 +1,56 @@
+import pytest
+import requests
+import eclypse_point_collector as collector
+import sessions
+import transport
+from fakes import FakeResponse, FakeSession
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(transport, '_backoff', lambda attempt: 0)
+
+
+def test_point_list_types(tmp_path):
+    point_file = tmp_path / 'points.csv'
+    point_file.write_text('# comment\n'
+                          'analog-value,1,present-value,Zone Temp\n'
+                          'binary-value,2\n'
+                          'multi-state-value,3\n'
+                          'multi-state-value,4,present-value,Mode,int64\n'
+                          'analog-value,5,object-name\n')
+    points = collector.read_point_list(point_file)
+    assert [point['type'] for point in points] == ['float64', 'bool', 'string', 'int64', 'string']
+    assert points[0]['name'] == 'Zone Temp'
+    assert points[1]['name'] == 'binary-value:2:present-value'
+
+
+def test_unknown_point_type(tmp_path):
+    point_file = tmp_path / 'points.csv'
+    point_file.write_text('analog-value,1,present-value,Zone Temp,decimal\n')
+    with pytest.raises(Exception, match='Unknown type'):
+        collector.read_point_list(point_file)
+
+
+def test_poll_returns_a_column_per_point(monkeypatch):
+    session = FakeSession(FakeResponse(body={'value': 21.5}), FakeResponse(body={'value': 'active'}))
+    monkeypatch.setattr(sessions, 'new_session', lambda username, password: session)
+    points = [{'point': ('analog-value', 1, 'present-value'), 'name': 'temp'},
+              {'point': ('binary-value', 2, 'present-value'), 'name': 'fan'}]
+
+    row = collector.poll({'hostname': '192.0.2.10', 'username': 'u', 'password': 'p'}, points)
+
+    assert row['host'] == '192.0.2.10'
+    assert sorted([row['temp'], row['fan']], key=str) == [21.5, 'active']
+    sessions.discard('192.0.2.10', 'u', 'p')
+
+
+def test_poll_discards_the_session_of_a_dead_controller(monkeypatch, no_backoff):
+    monkeypatch.setattr(sessions, 'new_session',
+                        lambda username, password: FakeSession(*[requests.exceptions.ConnectionError('refused')] * 10))
+    points = [{'point': ('analog-value', 1, 'present-value'), 'name': 'temp'}]
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        collector.poll({'hostname': '192.0.2.11', 'username': 'u', 'password': 'p'}, points)
+
+    assert ('192.0.2.11', 'u', 'p') not in sessions._sessions
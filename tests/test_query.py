@@ -0,0 +1,67 @@
+import argparse
+import pytest
+import query
+
+
+def matches(expression, **fields):
+    return query.Condition(expression).matches(fields)
+
+
+def test_parse_expressions():
+    condition = query.Condition(' firmware <= 1.18 ')
+    assert (condition.field, condition.operator, condition.value) == ('firmware', '<=', '1.18')
+    assert [str(condition) for condition in query.parse(['model=S1000', 'site!=lab'])] == ['model=S1000', 'site!=lab']
+    with pytest.raises(ValueError):
+        query.Condition('firmware')
+
+
+def test_argument_types_report_mistakes():
+    assert str(query.condition('site~east*')) == 'site~east*'
+    with pytest.raises(argparse.ArgumentTypeError):
+        query.condition('=1.18')
+    assert query.sample_size(' 5% ') == '5%'
+    assert query.sample_size('50') == '50'
+    with pytest.raises(argparse.ArgumentTypeError):
+        query.sample_size('half')
+
+
+def test_versions_compare_part_by_part():
+    assert matches('firmware<1.18', firmware='1.9.2')
+    assert not matches('firmware<1.18', firmware='1.18.1')
+    assert matches('firmware>=1.18', firmware='1.18')
+    assert not matches('firmware<1.18', firmware='unknown')
+
+
+def test_equal_ignores_case_and_matches_words():
+    assert matches('model=s1000', model='ECY-S1000 E2')
+    assert matches('model=ECY-S1000 E2', model='ecy-s1000 e2')
+    assert not matches('model=S100', model='ECY-S1000')
+
+
+def test_glob_cidr_and_lists():
+    assert matches('site~east*', site='East-12')
+    assert matches('hostname=10.1.0.0/16', hostname='10.1.20.3:443')
+    assert not matches('hostname=10.1.0.0/16', hostname='10.2.0.1')
+    assert matches('tags=pilot', tags=['lab', 'pilot'])
+    assert not matches('tags!=pilot', tags=['lab', 'pilot'])
+
+
+def test_unknown_values_only_match_not_equal():
+    assert not matches('model=S1000')
+    assert matches('site!=lab', site='')
+
+
+def test_select_uses_cached_facts_and_aliases(device_cache):
+    device_cache.put('ecy1', 'firmware', '1.17')
+    device_cache.put('ecy2', 'firmware', '1.18')
+    sites = [{'hostname': 'ecy1'}, {'hostname': 'ecy2'}, {'hostname': 'ecy3'}]
+    assert [site['hostname'] for site in query.select(sites, ['version<1.18'])] == ['ecy1']
+
+
+def test_sample_a_count_or_a_percentage():
+    sites = [{'hostname': f'h{index}'} for index in range(100)]
+    sample = query.sample_hosts(iter(sites), '10')
+    assert len(sample) == 10 and len({site['hostname'] for site in sample}) == 10
+    assert len(query.sample_hosts(sites, '200')) == 100
+    assert list(query.sample_hosts(sites, '0%')) == []
+    assert len(list(query.sample_hosts(sites, '100%'))) == 100
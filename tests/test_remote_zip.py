@@ -0,0 +1,73 @@
+import io
+import random
+import re
+import zipfile
+import remote_zip
+from fakes import FakeResponse
+
+
+class RangeSession:
+    """Serves a file over fake HTTP, honouring Range requests unless told otherwise"""
+
+    def __init__(self, data, ranges=True):
+        self.data = data
+        self.ranges = ranges
+        self.sent = 0
+
+    def request(self, method, url, headers=None, **kwargs):
+        match = re.match(r'bytes=(\d*)-(\d*)', (headers or {}).get('Range', ''))
+        if not self.ranges or not match:
+            self.sent += len(self.data)
+            return FakeResponse(200, content=self.data, headers={'Content-Length': str(len(self.data))})
+
+        first, last = match.groups()
+        if not first:
+            start, end = max(len(self.data) - int(last), 0), len(self.data)
+        else:
+            start, end = int(first), min(int(last) + 1, len(self.data)) if last else len(self.data)
+        self.sent += end - start
+        return FakeResponse(206, content=self.data[start:end],
+                            headers={'Content-Range': f'bytes {start}-{end - 1}/{len(self.data)}'})
+
+
+def archive():
+    """A zip with a small project file among large members"""
+    buffer = io.BytesIO()
+    source = random.Random(1)
+    with zipfile.ZipFile(buffer, 'w') as outfile:
+        outfile.writestr('trend.dat', source.randbytes(400000))
+        outfile.writestr('project.json', b'{"name": "plant"}')
+        outfile.writestr('logs.dat', source.randbytes(400000))
+    return buffer.getvalue()
+
+
+def test_reads_one_member_without_the_whole_archive():
+    data = archive()
+    session = RangeSession(data)
+    remote = remote_zip.RemoteFile(session, 'https://ecy1/archive.zip')
+    assert remote.ranged and remote.size == len(data)
+
+    with zipfile.ZipFile(remote) as zipped:
+        assert zipped.read('project.json') == b'{"name": "plant"}'
+    assert session.sent < len(data) / 4
+
+
+def test_whole_file_is_used_when_range_is_ignored():
+    data = archive()
+    session = RangeSession(data, ranges=False)
+    remote = remote_zip.RemoteFile(session, 'https://ecy1/archive.zip')
+    assert not remote.ranged
+
+    with zipfile.ZipFile(remote) as zipped:
+        assert zipped.read('project.json') == b'{"name": "plant"}'
+    assert session.sent == len(data)
+
+
+def test_reads_and_seeks_like_a_file():
+    data = bytes(range(256)) * 1000
+    remote = remote_zip.RemoteFile(RangeSession(data), 'https://ecy1/file.bin')
+    remote.seek(-10, io.SEEK_END)
+    assert remote.read() == data[-10:]
+    remote.seek(1000)
+    assert remote.read(5) == data[1000:1005]
+    assert remote.tell() == 1005
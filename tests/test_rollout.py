@@ -0,0 +1,39 @@
+import time
+import rollout
+
+
+def hosts(count):
+    return [{'hostname': f'10.0.{index}.1'} for index in range(count)]
+
+
+def slow_task(site):
+    time.sleep(0.2)
+    return {'host': site['hostname']}
+
+
+def failing_task(site):
+    raise Exception('failed')
+
+
+def test_waves_grow_and_cover_every_host():
+    plan = rollout.waves(hosts(20), canary=10, growth=2)
+    assert len(plan[0]) == 2
+    assert [site for wave in plan for site in wave] == hosts(20)
+
+
+def test_deadline_covers_the_whole_rollout():
+    start = time.monotonic()
+    results = list(rollout.run(hosts(20), slow_task, canary=10, growth=2, workers=2, deadline=0.5))
+    assert time.monotonic() - start < 1.5
+    assert len(results) == 20
+    assert sum(result.ok for result in results) < 20
+    assert {result.error for result in results if not result.ok} <= {'Skipped - deadline reached',
+                                                                     'Timed out - deadline reached'}
+
+
+def test_halt_skips_the_remaining_hosts():
+    results = list(rollout.run(hosts(40), failing_task, max_errors=10, workers=4, per_site=1))
+    started = [result for result in results if result.error == 'failed']
+    assert len(started) < 10
+    assert len(results) == 40
+    assert all(result.error == 'Skipped - rollout halted' for result in results if result.error != 'failed')
@@ -0,0 +1,44 @@
+import pytest
+from requests import exceptions
+import transport
+from fakes import FakeResponse, FakeSession
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = transport.CircuitBreaker(threshold=2, reset=60)
+    monkeypatch.setattr(transport, 'breaker', breaker)
+    monkeypatch.setattr(transport, '_backoff', lambda attempt: 0)
+    return breaker
+
+
+def test_open_circuit_fails_immediately(breaker):
+    session = FakeSession(exceptions.ConnectionError(), exceptions.ConnectionError())
+    with pytest.raises(exceptions.ConnectionError):
+        transport.request(session, 'GET', 'https://ecy1/api', retries=1)
+
+    with pytest.raises(transport.CircuitOpen):
+        transport.request(session, 'GET', 'https://ecy1/api')
+    assert len(session.requests) == 2
+
+
+def test_trial_request_does_not_make_others_wait(breaker, monkeypatch):
+    clock = [0]
+    monkeypatch.setattr(transport.time, 'monotonic', lambda: clock[0])
+    breaker.failure('ecy1')
+    breaker.failure('ecy1')
+
+    clock[0] = 61
+    breaker.check('ecy1')
+    with pytest.raises(transport.CircuitOpen):
+        breaker.check('ecy1')
+
+
+def test_polling_outside_the_breaker_does_not_close_it(breaker):
+    breaker.failure('ecy1')
+    breaker.failure('ecy1')
+
+    session = FakeSession(FakeResponse())
+    transport.request(session, 'GET', 'https://ecy1/api', use_breaker=False)
+    with pytest.raises(transport.CircuitOpen):
+        transport.request(session, 'GET', 'https://ecy1/api')
@@ -0,0 +1,188 @@
+import asyncio
+import random
+import threading
+import time
+import urllib.parse
+from requests import exceptions
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+# Request policy shared by every call to the ECLYPSE API
+# Every request has a timeout, idempotent requests are retried with backoff, and a
+# controller that keeps failing is skipped for a while instead of tying up a worker.
+
+# Seconds to connect and to wait for each read from the ECLYPSE
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+# Firmware and package uploads are checked by the ECLYPSE before it responds
+UPLOAD_TIMEOUT = (CONNECT_TIMEOUT, 300)
+
+# Attempts after the first for idempotent requests
+RETRIES = 2
+# First wait between attempts in seconds, doubled after each attempt
+BACKOFF = 1
+MAX_BACKOFF = 10
+# Responses that are worth retrying, the ECLYPSE web server is busy or restarting
+RETRY_STATUS = {502, 503, 504}
+# Methods that can be sent again without side effects
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# Consecutive failures that open the circuit for a host
+BREAKER_THRESHOLD = 5
+# Seconds before a single request is allowed through to test the host again
+BREAKER_RESET = 60
+
+
+class CircuitOpen(exceptions.RequestException):
+    """Raised instead of sending a request to a host that keeps failing"""
+
+
+class CircuitBreaker:
+    """Per host circuit breaker
+
+    After BREAKER_THRESHOLD consecutive connection failures or timeouts, requests to the host
+    fail immediately with CircuitOpen. After BREAKER_RESET seconds one request is let through,
+    a success closes the circuit and a failure opens it again.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.lock = threading.Lock()
+        # host: (consecutive failures, time the circuit opened)
+        self.hosts = {}
+
+    def check(self, host):
+        """Raise CircuitOpen while the circuit for host is open
+
+        Once BREAKER_RESET seconds have passed, one request is let through and the reset period
+        starts again, so other requests still raise CircuitOpen rather than wait for its outcome.
+        """
+        with self.lock:
+            failures, opened = self.hosts.get(host, (0, None))
+            if opened is None:
+                return
+            if time.monotonic() - opened < self.reset:
+                raise CircuitOpen(f'{host} failed {failures} times in a row, not retrying for {self.reset} seconds')
+            # Let one request through
+            self.hosts[host] = (failures, time.monotonic())
+
+    def success(self, host):
+        with self.lock:
+            self.hosts.pop(host, None)
+
+    def failure(self, host):
+        with self.lock:
+            failures, opened = self.hosts.get(host, (0, None))
+            failures += 1
+            if failures >= self.threshold:
+                opened = time.monotonic()
+            self.hosts[host] = (failures, opened)
+
+
+breaker = CircuitBreaker()
+
+
+def _host(url):
+    return urllib.parse.urlsplit(url).netloc
+
+
+def _backoff(attempt):
+    """Seconds to wait before the next attempt, with jitter so hosts do not retry in lockstep"""
+    return min(BACKOFF * 2 ** attempt, MAX_BACKOFF) * random.uniform(0.5, 1.5)
+
+
+def _retryable(e):
+    if isinstance(e, (exceptions.ConnectionError, exceptions.Timeout)):
+        return True
+    if httpx and isinstance(e, httpx.TransportError):
+        return True
+    return False
+
+
+def request(session, method, url, timeout=None, idempotent=None, retries=RETRIES, use_breaker=True, **kwargs):
+    """Send a request through the circuit breaker with a timeout and return the response
+
+    Idempotent requests are retried with backoff on connection failures, timeouts and
+    RETRY_STATUS responses. Requests with a streamed body must not be retried.
+    Without use_breaker, the request is sent even while the breaker is open and a failure
+    or success is not counted, for polling an ECLYPSE that is expected to be offline for a while.
+    """
+    host = _host(url)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    if not idempotent:
+        retries = 0
+
+    for attempt in range(retries + 1):
+        if use_breaker:
+            breaker.check(host)
+        try:
+            result = session.request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+        except Exception as e:
+            if not _retryable(e):
+                raise
+            if use_breaker:
+                breaker.failure(host)
+            if attempt == retries:
+                raise
+        else:
+            # Any response means the ECLYPSE is alive
+            if use_breaker:
+                breaker.success(host)
+            if result.status_code not in RETRY_STATUS or attempt == retries:
+                return result
+            result.close()
+
+        time.sleep(_backoff(attempt))
+
+
+async def arequest(client, method, url, timeout=None, idempotent=None, retries=RETRIES, use_breaker=True,
+                   stream=False, **kwargs):
+    """Async version of request() for an httpx.AsyncClient
+
+    With stream, the body is not read before returning and the response must be closed with aclose().
+    """
+    host = _host(url)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    if not idempotent:
+        retries = 0
+
+    if timeout is None:
+        timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    elif isinstance(timeout, tuple):
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+
+    for attempt in range(retries + 1):
+        if use_breaker:
+            breaker.check(host)
+        try:
+            if stream:
+                result = await client.send(client.build_request(method, url, timeout=timeout, **kwargs), stream=True)
+            else:
+                result = await client.request(method, url, timeout=timeout, **kwargs)
+        except Exception as e:
+            if not _retryable(e):
+                raise
+            if use_breaker:
+                breaker.failure(host)
+            if attempt == retries:
+                raise
+        else:
+            if use_breaker:
+                breaker.success(host)
+            if result.status_code not in RETRY_STATUS or attempt == retries:
+                return result
+            await result.aclose()
+
+        await asyncio.sleep(_backoff(attempt))
+
+
+if __name__ == '__main__':
+    pass
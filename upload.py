@@ -0,0 +1,136 @@
+import contextlib
+import mmap
+import os
+import uuid
+
+
+# Largest block handed to the socket at once while uploading
+CHUNK_SIZE = 64 * 1024
+
+
+class SharedFile:
+    """Firmware or package file mapped into memory once and shared by every upload
+
+    The file is paged in by the operating system on demand, so concurrent uploads to many
+    ECLYPSE share a single copy of the file instead of holding one copy each.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+        with open(path, 'rb') as infile:
+            self.size = os.fstat(infile.fileno()).st_size
+            # mmap cannot map an empty file
+            self.map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+        self.buffer = memoryview(self.map) if self.map else memoryview(b'')
+
+    def reader(self, progress=None, limiter=None):
+        """Return a new file-like reader with its own position in the shared buffer"""
+        return BufferReader(self.buffer, progress, limiter)
+
+    def multipart(self, field='file', progress=None, limiter=None):
+        """Return a new multipart/form-data reader with this file as its only field"""
+        return MultipartReader(field, self, progress, limiter)
+
+    def close(self):
+        self.buffer.release()
+        if self.map:
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BufferReader:
+    """File-like view of a buffer used as the body of a single upload
+
+    Reads return slices of the buffer, which the socket sends without copying.
+    A limiter, such as rollout.TokenBucket, is asked before each block so uploads share a bandwidth budget.
+    """
+
+    def __init__(self, buffer, progress=None, limiter=None):
+        self.buffer = buffer
+        self.size = len(buffer)
+        self.position = 0
+        self.progress = progress
+        self.limiter = limiter
+
+    def __len__(self):
+        # Remaining bytes, used by requests to set Content-Length
+        return self.size - self.position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self)
+        size = min(size, CHUNK_SIZE, len(self))
+        if self.limiter and size:
+            self.limiter.consume(size)
+
+        block = self.buffer[self.position:self.position + size]
+        self.position += size
+
+        if self.progress:
+            self.progress(self.position, self.size)
+        return block
+
+
+class MultipartReader:
+    """multipart/form-data body for a single file field, streamed from a SharedFile"""
+
+    def __init__(self, field, shared_file, progress=None, limiter=None):
+        boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+
+        head = (f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="{field}"; filename="{shared_file.name}"\r\n'
+                'Content-Type: application/octet-stream\r\n\r\n').encode()
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+
+        self.parts = [BufferReader(memoryview(head)),
+                      shared_file.reader(progress, limiter),
+                      BufferReader(memoryview(tail))]
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def read(self, size=-1):
+        for part in self.parts:
+            if len(part):
+                return part.read(size)
+        return b''
+
+
+@contextlib.contextmanager
+def shared(update_file):
+    """Use an already open SharedFile, or open a path for the duration of a single upload"""
+    if isinstance(update_file, SharedFile):
+        yield update_file
+        return
+
+    with SharedFile(update_file) as shared_file:
+        yield shared_file
+
+
+def print_progress(hostname, step=25):
+    """Return a progress callback that prints each time another `step` percent is uploaded"""
+    reported = [0]
+
+    def progress(sent, total):
+        percent = sent * 100 // total if total else 100
+        if percent >= reported[0] + step:
+            reported[0] = percent - percent % step
+            print({'host': hostname, 'status': f'Uploading - {reported[0]}%'})
+
+    return progress
+
+
+if __name__ == '__main__':
+    pass
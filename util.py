@@ -2,6 +2,7 @@ import os
 import time
 import sys
 import csv
+import inventory
 
 
 def to_csv(data, store_id=None, fieldnames=None):
@@ -57,8 +58,13 @@ def output_filename(extension='csv', store_id=None, appname=None):
 
 def read_host_list(host_list='./host_list.csv'):
     """Parse host list and yield hosts"""
+    # Host lists ending in .db or .sqlite are an inventory database
+    if inventory.is_database(host_list):
+        yield from inventory.iter(host_list)
+        return
+
     with open(host_list) as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=['hostname', 'username', 'password'])
+        reader = csv.DictReader(csvfile, fieldnames=['hostname', 'username', 'password', 'site'])
 
         for line in reader:
             yield line